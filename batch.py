@@ -0,0 +1,211 @@
+# batch.py
+'''
+Headless batch processing of capture folders, no window or Qt widgets needed
+
+    python batch.py apply FOLDER [--labels labels.csv]
+    python batch.py composite FOLDER [--output DIR]
+    python batch.py export FOLDER --output DIR [--shard-size MiB]
+
+Exit status: 0 on success, 1 if some pairs failed, 2 on usage errors,
+3 if there was nothing to process, 130 if interrupted
+'''
+import os
+import sys
+import csv
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_NO_INPUT = 3
+EXIT_INTERRUPTED = 130
+RECORD_CHUNK = 10000  # Labels recorded per manifest transaction
+
+class Progress:
+    '''
+    Prints throughput to stderr every few seconds and at the end
+    '''
+    def __init__(self, total, unit='pairs', interval=5):
+        self.total = total
+        self.unit = unit
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.start = self.last_report = time.perf_counter()
+
+    def update(self, done=1, failed=0):
+        self.done += done
+        self.failed += failed
+        now = time.perf_counter()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report()
+
+    def report(self):
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        print(f"{self.done}/{self.total} {self.unit}, {self.failed} failed, "
+              f"{self.done / elapsed:.1f} {self.unit}/s", file=sys.stderr)
+
+def chunked(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def read_label_list(path):
+    '''
+    Read `filename,category[,new_name]` rows, keyed by the normal image's stem
+    '''
+    labels = {}
+    with open(path, newline='') as f:
+        for row in csv.reader(f):
+            if not row or row[0].startswith('#') or row[0] == 'filename':
+                continue
+            stem = os.path.splitext(os.path.basename(row[0].strip()))[0]
+            labels[stem] = (row[1].strip(), row[2].strip() if len(row) > 2 and row[2].strip() else None)
+    return labels
+
+def command_apply(args):
+    from load_image import CATEGORY_LAYOUTS, MOVE_NORMAL, OUTPUT_DIRS
+    from manifest import LabelManifest, apply_manifest, manifest_path
+    from pair_index import PairIndex
+
+    manifest = LabelManifest(manifest_path(args.folder), args.folder)
+    if args.labels:
+        # Record the label list in the manifest so the pass is resumable
+        labels = read_label_list(args.labels)
+        rows = []
+        for path_1, path_2 in PairIndex(args.folder, args.recursive, OUTPUT_DIRS).build():
+            stem = os.path.splitext(os.path.basename(path_1))[0]
+            if stem in labels:
+                category, new_name = labels[stem]
+                rows.append((path_1, path_2, CATEGORY_LAYOUTS.get(category, MOVE_NORMAL), category, new_name))
+        # One transaction per chunk rather than per row
+        for chunk in chunked(rows, RECORD_CHUNK):
+            manifest.record_many(chunk)
+        print(f"Matched {len(rows)} of {len(labels)} labels to image pairs", file=sys.stderr)
+
+    pending = len(manifest.pending())
+    if not pending:
+        print("No pending labels to apply", file=sys.stderr)
+        return EXIT_NO_INPUT
+
+    progress = Progress(pending)
+    apply_manifest(manifest, args.workers, progress.update)
+    progress.report()
+    manifest.close()
+    return EXIT_FAILED if progress.failed else EXIT_OK
+
+def init_composite_worker(cache_dir, cache_bytes):
+    global worker_cache
+    from preview_cache import PreviewCache
+    from load_image import MAX_DISPLAY_WIDTH, MAX_DISPLAY_HEIGHT
+    worker_cache = None
+    if cache_dir:
+        worker_cache = PreviewCache(cache_dir, cache_bytes, version=f'{MAX_DISPLAY_WIDTH}x{MAX_DISPLAY_HEIGHT}')
+
+def composite_chunk(pairs, output):
+    '''
+    Compose a chunk of pairs in a worker process, returning (done, failed)
+    '''
+    import cv2
+    from load_image import compose_pair
+    done = failed = 0
+    for path_1, path_2 in pairs:
+        try:
+            key = worker_cache.key(path_1, path_2) if worker_cache else None
+            if worker_cache and key is None:
+                raise FileNotFoundError(path_1)
+            frame = compose_pair(path_1, path_2)
+            if worker_cache:
+                worker_cache.put(key, frame)
+            if output:
+                name = os.path.splitext(os.path.basename(path_1))[0] + '_combined.jpg'
+                if not cv2.imwrite(os.path.join(output, name), frame):
+                    raise OSError(f"Could not write {name}")
+            done += 1
+        except Exception as e:
+            print(f"Failed to compose {path_1}: {e}", file=sys.stderr)
+            failed += 1
+    return done, failed
+
+def command_composite(args):
+    from load_image import OUTPUT_DIRS
+    from pair_index import PairIndex
+
+    pairs = PairIndex(args.folder, args.recursive, OUTPUT_DIRS).build()
+    if not pairs:
+        print("No image pairs found", file=sys.stderr)
+        return EXIT_NO_INPUT
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    cache_dir = None if args.no_preview_cache else args.preview_cache
+
+    progress = Progress(len(pairs))
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_composite_worker,
+                             initargs=(cache_dir, args.preview_cache_size * 2**20)) as executor:
+        futures = [executor.submit(composite_chunk, chunk, args.output) for chunk in chunked(pairs, args.chunk_size)]
+        for future in futures:
+            progress.update(*future.result())
+    progress.report()
+    return EXIT_FAILED if progress.failed else EXIT_OK
+
+def command_export(args):
+    from export import load_plan, export_shards
+
+    try:
+        plan = load_plan(args.output, args.folder, args.shard_size * 2**20, args.replan)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return EXIT_USAGE
+    total = sum(len(shard) for shard in plan['shards'])
+    if not total:
+        print("No labelled pairs to export", file=sys.stderr)
+        return EXIT_NO_INPUT
+
+    progress = Progress(total, unit='samples')
+    samples, failed = export_shards(args.output, plan, args.workers, progress.update)
+    progress.report()
+    print(f"Exported {samples} samples to {args.output}, {failed} failed", file=sys.stderr)
+    return EXIT_FAILED if failed else EXIT_OK
+
+def parse_args(argv):
+    from preview_cache import DEFAULT_CACHE_DIR
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    apply_parser = subparsers.add_parser('apply', help='Move labelled pairs into their category folders')
+    apply_parser.add_argument('--labels', help='CSV of filename,category[,new_name] to apply instead of the manifest')
+
+    composite_parser = subparsers.add_parser('composite', help='Pre-generate side-by-side previews')
+    composite_parser.add_argument('--output', help='Also write the previews as JPEGs into this folder')
+    composite_parser.add_argument('--preview-cache', default=DEFAULT_CACHE_DIR, help='Preview cache folder to fill')
+    composite_parser.add_argument('--no-preview-cache', action='store_true', help='Do not fill the preview cache')
+    composite_parser.add_argument('--preview-cache-size', type=int, default=2048, help='Preview cache budget in MiB')
+    composite_parser.add_argument('--chunk-size', type=int, default=64, help='Pairs per worker task')
+
+    export_parser = subparsers.add_parser('export', help='Pack labelled pairs into tar shards with a JSONL index')
+    export_parser.add_argument('--output', required=True, help='Folder for the shards, index and plan')
+    export_parser.add_argument('--shard-size', type=int, default=1024, help='Maximum shard size in MiB')
+    export_parser.add_argument('--replan', action='store_true',
+                               help='Start over from the current labels instead of resuming an earlier export')
+
+    for subparser in (apply_parser, composite_parser, export_parser):
+        subparser.add_argument('folder', help='Folder with image pairs')
+        subparser.add_argument('--recursive', action='store_true', help='Also look for image pairs in subfolders')
+        subparser.add_argument('--workers', type=int, default=os.cpu_count(), help='Number of parallel workers')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.isdir(args.folder):
+        print(f"Not a folder: {args.folder}", file=sys.stderr)
+        return EXIT_USAGE
+    commands = {'apply': command_apply, 'composite': command_composite, 'export': command_export}
+    try:
+        return commands[args.command](args)
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+
+if __name__ == "__main__":
+    sys.exit(main())
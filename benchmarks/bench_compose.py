@@ -0,0 +1,102 @@
+# bench_compose.py
+'''
+Per-label cost of composing and displaying a pair: the original allocate-per-stage
+path against decoding and resizing straight into the preallocated history canvas
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_compose.py --pairs 50
+'''
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import cv2
+import numpy as np
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtWidgets import QApplication
+from history_strip import HistoryStrip
+from load_image import decode_pair, composed_size, compose_into
+from pair_index import PairIndex
+from synthetic import generate_dataset
+
+class OriginalPath:
+    '''
+    The composition in load_next_image_pair before the preallocated canvas:
+    imread, cvtColor, resize to a common height, hstack, fit, vstack, copy
+    '''
+    def __init__(self):
+        self.prev_combined_image = None
+
+    def show(self, path_1, path_2):
+        image_1 = cv2.cvtColor(cv2.imread(path_1), cv2.COLOR_BGR2RGB)
+        image_2 = cv2.cvtColor(cv2.imread(path_2), cv2.COLOR_BGR2RGB)
+        height = max(image_1.shape[0], image_2.shape[0])
+        image_1 = cv2.resize(image_1, (int(image_1.shape[1] * height / image_1.shape[0]), height))
+        image_2 = cv2.resize(image_2, (int(image_2.shape[1] * height / image_2.shape[0]), height))
+        combined_image = np.hstack((image_2, image_1))
+        h, w, _ = combined_image.shape
+        if h > 756 or w > 1330:
+            scaling_factor = min(1330 / w, 756 / h)
+            combined_image = cv2.resize(combined_image, (int(w * scaling_factor), int(h * scaling_factor)))
+        if self.prev_combined_image is not None:
+            # Only one strip of history so both paths show the same amount
+            combined_image = np.vstack((combined_image, self.prev_combined_image[:combined_image.shape[0]]))
+        create_combined_image = combined_image.copy()
+        height, width, _ = combined_image.shape
+        qImg = QImage(combined_image.data, width, height, 3 * width, QImage.Format_RGB888)
+        pixmap = QPixmap.fromImage(qImg)
+        self.prev_combined_image = create_combined_image
+        return pixmap
+
+class PreallocatedPath:
+    def __init__(self):
+        self.history = HistoryStrip(1)
+
+    def show(self, path_1, path_2):
+        image_1, image_2 = decode_pair(path_1, path_2, reduced_decode=False)
+        compose_into(image_1, image_2, self.history.advance(composed_size(image_1, image_2) + (3,)))
+        combined_image = self.history.render()
+        height, width, _ = combined_image.shape
+        qImg = QImage(combined_image.data, width, height, 3 * width, QImage.Format_BGR888)
+        return QPixmap.fromImage(qImg)
+
+def run(path, pairs):
+    times, peaks = [], []
+    tracemalloc.start()
+    for path_1, path_2 in pairs:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        path.show(path_1, path_2)
+        times.append(time.perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+    # Skip the first label, which allocates the preallocated buffers
+    return np.array(times[1:]) * 1000, np.array(peaks[1:]) / 2**20
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pairs', type=int, default=50)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    args = parser.parse_args()
+
+    app = QApplication([])
+    with tempfile.TemporaryDirectory() as folder:
+        generate_dataset(folder, args.pairs, args.width, args.height)
+        pairs = PairIndex(folder).build()
+        print(f'{len(pairs)} pairs at {args.width}x{args.height}, full-resolution decode in both paths')
+        for name, path in (('original', OriginalPath()), ('preallocated', PreallocatedPath())):
+            times, peaks = run(path, pairs)
+            print(f'{name:>13}: mean {times.mean():6.1f} ms  p95 {np.percentile(times, 95):6.1f} ms  '
+                  f'transient allocations {peaks.mean():6.1f} MiB/label')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# bench_decode.py
+'''
+Decode+compose time and peak RSS with full-resolution vs reduced JPEG decode
+
+    python benchmarks/bench_decode.py --pairs 20 --width 3840 --height 2160
+'''
+import os
+import sys
+import time
+import json
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+def peak_rss():
+    '''
+    Peak resident set size of this process in bytes
+    ru_maxrss would carry over the parent's peak across fork and exec on Linux
+    '''
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    return None
+
+def run_worker(folder, mode):
+    from load_image import compose_pair
+    from pair_index import PairIndex
+    pairs = PairIndex(folder).build()
+    start = time.perf_counter()
+    for path_1, path_2 in pairs:
+        compose_pair(path_1, path_2, reduced_decode=(mode == 'reduced'))
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'mode': mode, 'pairs': len(pairs), 'seconds': elapsed, 'peak_rss': peak_rss()}))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pairs', type=int, default=20)
+    parser.add_argument('--width', type=int, default=3840)
+    parser.add_argument('--height', type=int, default=2160)
+    parser.add_argument('--worker', nargs=2, metavar=('FOLDER', 'MODE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(*args.worker)
+        return
+
+    from synthetic import generate_dataset
+
+    with tempfile.TemporaryDirectory() as folder:
+        generate_dataset(folder, args.pairs, args.width, args.height, variants=args.pairs)
+        print(f'{args.pairs} pairs at {args.width}x{args.height}')
+        # Each mode runs in a fresh process so peak RSS is not shared between them
+        for mode in ('full', 'reduced'):
+            output = subprocess.run([sys.executable, __file__, '--worker', folder, mode],
+                                    check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{mode:>8}: {result['seconds'] / result['pairs'] * 1000:7.1f} ms/pair  "
+                  f"peak RSS {result['peak_rss'] / 2**20:7.1f} MiB")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# bench_magnifier.py
+'''
+Per-move latency of the magnifying glass in 'full' and 'overlay' render modes
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_magnifier.py
+'''
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtWidgets import QApplication, QLabel
+from magnifyingglass import MagnifyingGlass
+
+class FakeLoader:
+    def __init__(self, image):
+        self.create_combined_image = image
+        self.current_image_path_1 = 'normal.jpg'
+        self.current_image_path_2 = 'debug.jpg'
+        height, width, _ = image.shape
+        self.image_label = QLabel()
+        self.image_label.resize(width, height)
+        qImg = QImage(image.data, width, height, 3 * width, QImage.Format_BGR888)
+        self.image_label.setPixmap(QPixmap.fromImage(qImg))
+
+class FakeEvent:
+    def __init__(self, x, y):
+        self._x, self._y = x, y
+
+    def x(self):
+        return self._x
+
+    def y(self):
+        return self._y
+
+def cursor_path(width, height, moves):
+    t = np.linspace(0, 2 * np.pi, moves)
+    xs = (width / 2 + 0.4 * width * np.cos(t)).astype(int)
+    ys = (height / 2 + 0.4 * height * np.sin(3 * t)).astype(int)
+    return list(zip(xs.tolist(), ys.tolist()))
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q)) * 1000
+
+def bench_render(app, image, mode, moves, size, zoom):
+    loader = FakeLoader(image)
+    magnifier = MagnifyingGlass(loader, size, zoom, render_mode=mode, source_cache_bytes=0)
+    samples = []
+    for pos in cursor_path(image.shape[1], image.shape[0], moves):
+        magnifier.magnifying_glass_pos = pos
+        start = time.perf_counter()
+        magnifier.update_image_display()
+        samples.append(time.perf_counter() - start)
+    app.processEvents()
+    return samples
+
+def bench_coalescing(app, image, moves, size, zoom, interval):
+    # Deliver mouse moves faster than the display refreshes and count the renders
+    loader = FakeLoader(image)
+    magnifier = MagnifyingGlass(loader, size, zoom, render_mode='overlay', source_cache_bytes=0)
+    renders = []
+    update = magnifier.update_image_display
+    magnifier.update_image_display = lambda: (renders.append(1), update())
+    for x, y in cursor_path(image.shape[1], image.shape[0], moves):
+        magnifier.mouseMoveEvent(FakeEvent(x, y))
+        app.processEvents()
+        time.sleep(interval)
+    time.sleep(0.05)
+    app.processEvents()
+    return len(renders)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--width', type=int, default=1330)
+    parser.add_argument('--height', type=int, default=1512)
+    parser.add_argument('--moves', type=int, default=300)
+    parser.add_argument('--size', type=int, default=500)
+    parser.add_argument('--zoom', type=int, default=3)
+    args = parser.parse_args()
+
+    app = QApplication([])
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8)
+
+    print(f'frame {args.width}x{args.height}, lens {args.size}px, zoom {args.zoom}x, {args.moves} moves')
+    for mode in ('full', 'overlay'):
+        samples = bench_render(app, image, mode, args.moves, args.size, args.zoom)
+        print(f'{mode:>8}: mean {np.mean(samples) * 1000:7.2f} ms  '
+              f'p50 {percentile_ms(samples, 50):7.2f} ms  p95 {percentile_ms(samples, 95):7.2f} ms')
+
+    renders = bench_coalescing(app, image, args.moves, args.size, args.zoom, 0.001)
+    print(f'coalescing: {args.moves} moves at ~1 kHz -> {renders} renders')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# bench_startup.py
+'''
+Time from launch until the window is shown and until the pair list is ready
+
+    python benchmarks/bench_startup.py --pairs 50000 --repeat 3
+
+Each run is a fresh interpreter. 'lazy-background' is the normal launch path,
+'eager-blocking' imports cv2 and numpy up front and scans before showing the
+window, as the labeller used to.
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+MODES = ('lazy-background', 'eager-blocking')
+
+def run_worker(folder, mode, launched):
+    marks = {}
+    if mode == 'eager-blocking':
+        import cv2, numpy
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtWidgets import QApplication
+    from main import ImageInspector
+    marks['imported'] = time.time() - launched
+
+    app = QApplication([])
+    loader_options = {'watch_interval': 0, 'quality_workers': 0, 'preview_cache_dir': None,
+                      'background_scan': mode != 'eager-blocking'}
+    inspector = ImageInspector(loader_options, folder=folder)
+    inspector.show()
+    app.processEvents()
+    marks['shown'] = time.time() - launched
+
+    while inspector.loader.scanning:
+        app.processEvents()
+        time.sleep(0.001)
+    marks['pairs_ready'] = time.time() - launched
+    marks['pairs'] = len(inspector.loader.image_pairs)
+    inspector.loader.shutdown()
+    print(json.dumps(marks))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pairs', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--worker', nargs=3, metavar=('FOLDER', 'MODE', 'LAUNCHED'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker[0], args.worker[1], float(args.worker[2]))
+        return
+
+    from synthetic import generate_dataset
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        generate_dataset(workdir, args.pairs, 64, 36, variants=1)
+        for mode in MODES:
+            runs = []
+            for _ in range(args.repeat):
+                launched = time.time()
+                output = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', workdir, mode, repr(launched)],
+                                        capture_output=True, text=True, check=True).stdout
+                runs.append(json.loads(output.strip().splitlines()[-1]))
+            results[mode] = {mark: statistics.median(run[mark] for run in runs) for mark in ('imported', 'shown', 'pairs_ready')}
+            results[mode]['pairs'] = runs[0]['pairs']
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
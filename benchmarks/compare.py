@@ -0,0 +1,43 @@
+# compare.py
+'''
+Compare two run_benchmarks.py result files and flag regressions
+
+    python benchmarks/compare.py baseline.json results.json --threshold 1.2
+
+Exits with status 1 if any benchmark got slower than the threshold ratio.
+'''
+import sys
+import json
+import argparse
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=1.2, help='Slowdown ratio counted as a regression')
+    parser.add_argument('--metric', default='mean_ms', help='Result field to compare, e.g. mean_ms or p95_ms')
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    print(f"baseline {baseline.get('commit') or '?'}  current {current.get('commit') or '?'}  ({args.metric})")
+    regressions = 0
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name, {}).get(args.metric)
+        after = result.get(args.metric)
+        if before is None or after is None:
+            print(f"{name:50s} {'':>10s} {after if after is not None else float('nan'):10.3f}   new")
+            continue
+        ratio = after / before if before else float('inf')
+        flag = ''
+        if ratio > args.threshold:
+            flag = 'REGRESSION'
+            regressions += 1
+        print(f"{name:50s} {before:10.3f} {after:10.3f} {ratio:6.2f}x {flag}")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+# run_benchmarks.py
+'''
+Reproducible timings of the labeller's hot paths on a synthetic dataset
+
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/compare.py baseline.json results.json
+
+Runs on the Qt offscreen platform, so no display is needed.
+'''
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import numpy as np
+from PyQt5.QtWidgets import QApplication, QLabel
+from synthetic import generate_dataset
+
+def summarize(samples):
+    samples = np.asarray(samples) * 1000
+    return {
+        'n': int(samples.size),
+        'mean_ms': float(samples.mean()),
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p95_ms': float(np.percentile(samples, 95)),
+        'min_ms': float(samples.min()),
+        'total_s': float(samples.sum() / 1000),
+    }
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def make_loader(folder, **options):
+    from load_image import LoadImage
+    labels = [QLabel() for _ in range(5)]
+    # Background quality scoring would compete with the code being timed
+    options = {'prefetch_depth': 0, 'watch_interval': 0, 'quality_workers': 0, **options}
+    return LoadImage(folder, *labels, **options)
+
+def bench_find_image_pairs(folder, repeat):
+    loader = make_loader(folder)
+    samples = [timed(loader.find_image_pairs) for _ in range(repeat)]
+    loader.shutdown()
+    return summarize(samples)
+
+def bench_load_next_image_pair(app, folder, count):
+    loader = make_loader(folder)
+    samples = []
+    for _ in range(min(count, len(loader.image_pairs))):
+        samples.append(timed(loader.load_next_image_pair))
+        app.processEvents()
+    loader.shutdown()
+    return summarize(samples)
+
+def bench_magnifier(app, folder, moves):
+    from magnifyingglass import MagnifyingGlass
+    loader = make_loader(folder)
+    loader.load_next_image_pair()
+    image = loader.create_combined_image
+    height, width, _ = image.shape
+    t = np.linspace(0, 2 * np.pi, moves)
+    path = list(zip((width / 2 + 0.4 * width * np.cos(t)).astype(int).tolist(),
+                    (height / 2 + 0.4 * height * np.sin(3 * t)).astype(int).tolist()))
+
+    magnifier = MagnifyingGlass(loader, source_cache_bytes=0)
+    results = {
+        'draw_magnifying_glass': summarize([timed(magnifier.draw_magnifying_glass, image, pos) for pos in path]),
+        'draw_lens': summarize([timed(magnifier.draw_lens, image, pos) for pos in path]),
+    }
+    loader.shutdown()
+    return results
+
+def bench_moves(app, folder, count):
+    '''
+    Time each move function on the UI thread and until its files have moved
+    '''
+    results = {}
+    calls = [
+        ('move_image', lambda loader: loader.move_image('bench/split', None)),
+        ('move_image_without_creating_folders', lambda loader: loader.move_image_without_creating_folders('bench/normal', None)),
+        ('move_image_without_creating_folders_both', lambda loader: loader.move_image_without_creating_folders_both('bench/both', None)),
+    ]
+    for name, call in calls:
+        loader = make_loader(folder)
+        loader.load_next_image_pair()
+        ui_samples, flushed_samples = [], []
+        for _ in range(min(count, len(loader.image_pairs) - 1)):
+            start = time.perf_counter()
+            call(loader)
+            ui_samples.append(time.perf_counter() - start)
+            loader.mover.queue.join()
+            flushed_samples.append(time.perf_counter() - start)
+            app.processEvents()
+        loader.shutdown()
+        results[name] = summarize(ui_samples)
+        results[name + '_flushed'] = summarize(flushed_samples)
+    return results
+
+def bench_extract_full_identifier(folder, repeat):
+    loader = make_loader(folder)
+    paths = [path for pair in loader.image_pairs for path in pair]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for path in paths:
+            loader.extract_full_identifier(path)
+    elapsed = time.perf_counter() - start
+    loader.shutdown()
+    # Per-call timings are too small for perf_counter, report the average instead
+    per_call = elapsed / (repeat * len(paths))
+    return {'n': repeat * len(paths), 'mean_ms': per_call * 1000, 'total_s': elapsed}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pairs', type=int, default=200, help='Pairs in the dataset for load and move timings')
+    parser.add_argument('--index-pairs', type=int, default=20000, help='Pairs in the dataset for find_image_pairs')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--moves', type=int, default=300, help='Mouse moves for the magnifier timings')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write JSON results here instead of stdout')
+    args = parser.parse_args()
+
+    app = QApplication([])
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        dataset = os.path.join(workdir, 'dataset')
+        index_dataset = os.path.join(workdir, 'index')
+        generate_dataset(dataset, args.pairs, args.width, args.height, seed=args.seed)
+        generate_dataset(index_dataset, args.index_pairs, 64, 36, variants=1, seed=args.seed)
+
+        results['find_image_pairs'] = bench_find_image_pairs(index_dataset, args.repeat)
+        results['extract_full_identifier'] = bench_extract_full_identifier(index_dataset, 1)
+        results['load_next_image_pair'] = bench_load_next_image_pair(app, dataset, args.pairs)
+        results.update(bench_magnifier(app, dataset, args.moves))
+
+        # Moves are destructive, so they get their own copy of the dataset
+        move_dataset = os.path.join(workdir, 'moves')
+        shutil.copytree(dataset, move_dataset)
+        results.update(bench_moves(app, move_dataset, args.pairs // 3))
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'params': vars(args),
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# synthetic.py
+'''
+Generate synthetic LPR capture folders of YYYY_MM_DD_HH_MM_SS_lprXXXX.jpg / _debug.jpg pairs
+
+    python benchmarks/synthetic.py OUTPUT --count 1000 --width 1920 --height 1080
+'''
+import os
+import argparse
+import datetime
+import cv2
+import numpy as np
+
+PLATE_CHARS = 'ABCDEFGHJKLMNPQRSTUVWXYZ0123456789'
+
+def random_plate(rng):
+    letters = ''.join(rng.choice(list(PLATE_CHARS[:24]), 3))
+    digits = ''.join(rng.choice(list(PLATE_CHARS[24:]), 4))
+    return f'{letters}{digits}{rng.choice(list(PLATE_CHARS[:24]))}'
+
+def render_frame(rng, width, height, plate):
+    '''
+    Smooth background with a plate-like box; compresses like a real capture
+    '''
+    noise = rng.integers(0, 256, (max(1, height // 32), max(1, width // 32), 3), dtype=np.uint8)
+    frame = cv2.resize(noise, (width, height), interpolation=cv2.INTER_CUBIC)
+    x, y = width // 3, height // 2
+    scale = max(height / 400, 0.5)
+    cv2.rectangle(frame, (x - 20, y - int(60 * scale)), (x + int(330 * scale), y + int(20 * scale)), (230, 230, 230), -1)
+    cv2.putText(frame, plate, (x, y), cv2.FONT_HERSHEY_SIMPLEX, scale, (20, 20, 20), max(1, int(3 * scale)))
+    return frame
+
+def render_debug(frame):
+    debug = frame.copy()
+    height, width, _ = debug.shape
+    cv2.rectangle(debug, (width // 3 - 30, height // 3), (2 * width // 3, 2 * height // 3), (0, 255, 0), max(2, height // 270))
+    return debug
+
+def generate_dataset(folder, count, width=1920, height=1080, variants=8, seed=0,
+                     start=datetime.datetime(2024, 6, 6, 0, 0, 0), burst=1):
+    '''
+    Write `count` image pairs into folder and return their file stems
+    Only `variants` distinct frames are encoded and their bytes reused, so large
+    folders are quick to generate. Captures are one second apart, and `burst`
+    consecutive captures share a plate like a camera following one vehicle.
+    '''
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    encoded = []
+    for _ in range(max(1, min(variants, count))):
+        frame = render_frame(rng, width, height, random_plate(rng))
+        encoded.append((cv2.imencode('.jpg', frame)[1].tobytes(), cv2.imencode('.jpg', render_debug(frame))[1].tobytes()))
+
+    stems = []
+    plate = random_plate(rng)
+    for i in range(count):
+        if i % burst == 0:
+            plate = random_plate(rng)
+        timestamp = (start + datetime.timedelta(seconds=i)).strftime('%Y_%m_%d_%H_%M_%S')
+        stem = f'{timestamp}_lpr{plate}'
+        normal, debug = encoded[i % len(encoded)]
+        with open(os.path.join(folder, stem + '.jpg'), 'wb') as f:
+            f.write(normal)
+        with open(os.path.join(folder, stem + '_debug.jpg'), 'wb') as f:
+            f.write(debug)
+        stems.append(stem)
+    return stems
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('output', help='Folder to write the pairs into')
+    parser.add_argument('--count', type=int, default=1000)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--variants', type=int, default=8, help='Distinct frames to encode')
+    parser.add_argument('--burst', type=int, default=1, help='Consecutive captures sharing a plate')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    stems = generate_dataset(args.output, args.count, args.width, args.height, args.variants, args.seed, burst=args.burst)
+    print(f'Wrote {len(stems)} pairs to {args.output}')
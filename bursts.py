@@ -0,0 +1,84 @@
+# bursts.py
+import os
+import re
+import calendar
+from concurrent.futures import ThreadPoolExecutor
+from lazy import lazy_import
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+CAPTURE_PATTERN = re.compile(r'(\d{4})_(\d{2})_(\d{2})_(\d{2})_(\d{2})_(\d{2})_lpr([A-Z0-9]+)')
+
+def parse_capture(path):
+    '''
+    Return (seconds since the epoch, plate) from a capture file name, or None
+    '''
+    match = CAPTURE_PATTERN.match(os.path.basename(path))
+    if not match:
+        return None
+    year, month, day, hour, minute, second = (int(group) for group in match.groups()[:6])
+    return calendar.timegm((year, month, day, hour, minute, second)), match.group(7)
+
+def dhash(path, size=8):
+    '''
+    Difference hash of an image as a size*size bit integer, or None if it cannot be read
+    '''
+    try:
+        data = np.fromfile(path, dtype=np.uint8)
+    except OSError:
+        return None
+    gray = cv2.imdecode(data, cv2.IMREAD_REDUCED_GRAYSCALE_8) if data.size else None
+    if gray is None:
+        return None
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+def hamming(hash_1, hash_2):
+    return bin(hash_1 ^ hash_2).count('1')
+
+def group_bursts(pairs, window=10, max_distance=None, workers=4):
+    '''
+    Cluster pairs into bursts of the same plate captured at most `window` seconds apart
+    Pairs are expected in capture order and clusters keep that order, each one
+    listed where its first capture is. With max_distance, a capture only joins a
+    burst if the dHash of its image is that close to the previous capture's.
+    Pairs without a parsable name are never grouped.
+    '''
+    captures = [parse_capture(pair[0]) for pair in pairs]
+
+    hashes = {}
+    if max_distance is not None:
+        # Only captures that would otherwise join a burst need a hash, with the capture before them
+        candidates = set()
+        last_seen = {}
+        for index, capture in enumerate(captures):
+            if capture is None:
+                continue
+            seconds, plate = capture
+            previous = last_seen.get(plate)
+            if previous is not None and seconds - captures[previous][0] <= window:
+                candidates.update((previous, index))
+            last_seen[plate] = index
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dhash') as executor:
+            indices = sorted(candidates)
+            hashes = dict(zip(indices, executor.map(dhash, [pairs[index][0] for index in indices])))
+
+    clusters = []
+    open_bursts = {}
+    for index, (pair, capture) in enumerate(zip(pairs, captures)):
+        if capture is None:
+            clusters.append([pair])
+            continue
+        seconds, plate = capture
+        burst = open_bursts.get(plate)
+        if burst is not None and seconds - burst['seconds'] <= window:
+            if max_distance is None or (hashes.get(index) is not None and hashes.get(burst['index']) is not None
+                                        and hamming(hashes[index], hashes[burst['index']]) <= max_distance):
+                burst['members'].append(pair)
+                burst['seconds'], burst['index'] = seconds, index
+                continue
+        members = [pair]
+        clusters.append(members)
+        open_bursts[plate] = {'members': members, 'seconds': seconds, 'index': index}
+    return clusters
@@ -0,0 +1,305 @@
+# export.py
+'''
+Pack labelled pairs into size-capped tar shards for training
+
+Every sample is stored as KEY.jpg, KEY.debug.jpg when the debug image was kept,
+and KEY.json with its label, plate, capture time and renamed text, next to each
+other so readers can stream a shard front to back. index.jsonl lists every sample
+with its shard and the offset, size and SHA-256 of each member, SHA256SUMS has
+the checksum of each shard. The shard plan is written before any shard, so an
+interrupted export only writes the shards that were not finished.
+
+load_plan() makes or resumes the plan, export_shards() writes it.
+'''
+import io
+import os
+import glob
+import re
+import sys
+import json
+import time
+import tarfile
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from bursts import parse_capture
+
+PLAN_NAME = 'plan.json'
+DONE_NAME = 'done.jsonl'
+INDEX_NAME = 'index.jsonl'
+SUMS_NAME = 'SHA256SUMS'
+SHARD_PATTERN = re.compile(r'shard-\d{5}\.(tar|jsonl|part)$')
+METADATA_FIELDS = ('key', 'label', 'plate', 'timestamp', 'renamed', 'source')
+
+def shard_name(number):
+    return f'shard-{number:05d}.tar'
+
+def padded(size):
+    return -(-size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+
+def member_bytes(name, size):
+    # Names over 100 bytes need a pax header, which takes a header and a data block of its own
+    header = tarfile.BLOCKSIZE if len(name.encode()) <= 100 else 3 * tarfile.BLOCKSIZE
+    return header + padded(size)
+
+def sample_metadata(record):
+    return {field: record[field] for field in METADATA_FIELDS}
+
+def label_origins(folder):
+    '''
+    Map labelled files to the capture they were moved from, as far as the move
+    journal and the label manifest still know; renamed files lost it from their name
+    '''
+    from load_image import STATE_DIR, plan_moves
+    from manifest import LabelManifest, manifest_path
+    origins = {}
+    path = manifest_path(folder)
+    if os.path.exists(path):
+        manifest = LabelManifest(path, folder)
+        for path_1, path_2, layout, category, new_name in manifest.applied():
+            origins[plan_moves(layout, folder, category, new_name, path_1, path_2)[0][1]] = path_1
+        manifest.close()
+    # Journals only keep recent actions, later ones win; shared folders have one per instance
+    journal_paths = glob.glob(os.path.join(folder, STATE_DIR, 'journal.jsonl')) + \
+                    glob.glob(os.path.join(folder, STATE_DIR, '*', 'journal.jsonl'))
+    for journal_path in sorted(journal_paths, key=os.path.getmtime):
+        with open(journal_path) as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # Torn write at the end of the journal
+                if record['op'] == 'begin':
+                    origins.update((dst, src) for src, dst in record['moves'][:1])
+    return origins
+
+def make_record(label, path_1, path_2, source, new_name=None):
+    # Keyed by the name the pair has once the label is applied
+    stem = new_name or os.path.splitext(os.path.basename(path_1))[0]
+    capture = parse_capture(source)
+    renamed = new_name
+    if renamed is None and (capture is None or os.path.basename(source) != os.path.basename(path_1)):
+        renamed = stem
+    files = [path for path in (path_1, path_2) if path]
+    return {
+        'key': f'{label}/{stem}',
+        'label': label,
+        'plate': capture[1] if capture else None,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(capture[0])) if capture else None,
+        'renamed': renamed,
+        'source': os.path.basename(source),
+        'normal': path_1,
+        'debug': path_2,
+        'sizes': [os.path.getsize(path) for path in files],
+        'mtime': int(os.path.getmtime(path_1)),
+    }
+
+def collect_labelled(folder):
+    '''
+    List the labelled pairs of a folder as export records
+    Moved pairs are found in the category folders, pairs labelled in label-only
+    mode through the manifest. Records are sorted by label and capture time
+    '''
+    from load_image import OUTPUT_DIRS, MOVE_NORMAL
+    from manifest import LabelManifest, manifest_path
+    origins = label_origins(folder)
+    records = []
+    for category in OUTPUT_DIRS:
+        for dirpath, dirnames, filenames in os.walk(os.path.join(folder, category)):
+            label = os.path.relpath(dirpath, folder)
+            if os.path.basename(label) == 'debug':
+                continue  # Picked up with the normal image
+            split = os.path.basename(label) == 'normal'
+            if split:
+                label = os.path.dirname(label)
+            names = set(filenames)
+            for name in filenames:
+                if not name.endswith('.jpg') or name.endswith('_debug.jpg'):
+                    continue
+                debug_name = name[:-4] + '_debug.jpg'
+                if split:
+                    path_2 = os.path.join(folder, label, 'debug', debug_name)
+                    path_2 = path_2 if os.path.exists(path_2) else None
+                else:
+                    path_2 = os.path.join(dirpath, debug_name) if debug_name in names else None
+                path_1 = os.path.join(dirpath, name)
+                records.append(make_record(label, path_1, path_2, origins.get(path_1, path_1)))
+
+    path = manifest_path(folder)
+    if os.path.exists(path):
+        manifest = LabelManifest(path, folder)
+        for path_1, path_2, layout, category, new_name in manifest.pending():
+            if os.path.exists(path_1):
+                # Exported as they will be once applied, the normal layout drops the debug image
+                keep_debug = layout != MOVE_NORMAL and os.path.exists(path_2)
+                records.append(make_record(category, path_1, path_2 if keep_debug else None, path_1, new_name))
+        manifest.close()
+
+    records.sort(key=lambda record: (record['label'], record['timestamp'] or '', record['key']))
+    # Keys must be unique within the export, e.g. a split and a flat folder of one category
+    seen = set()
+    for record in records:
+        key, n = record['key'], 1
+        while record['key'] in seen:
+            n += 1
+            record['key'] = f'{key}_{n}'
+        seen.add(record['key'])
+    return records
+
+def record_bytes(record):
+    suffixes = ['.jpg', '.debug.jpg'][:len(record['sizes'])]
+    size = sum(member_bytes(record['key'] + suffix, file_size) for suffix, file_size in zip(suffixes, record['sizes']))
+    return size + member_bytes(record['key'] + '.json', len(json.dumps(sample_metadata(record)).encode()))
+
+def plan_shards(records, shard_bytes):
+    '''
+    Split records into consecutive shards of at most shard_bytes each
+    A sample bigger than a shard gets a shard of its own
+    '''
+    # Room for the end-of-archive blocks and the padding to a whole tar record
+    capacity = shard_bytes - 2 * tarfile.RECORDSIZE
+    shards, shard, size = [], [], 0
+    for record in records:
+        size_of_record = record_bytes(record)
+        if shard and size + size_of_record > capacity:
+            shards.append(shard)
+            shard, size = [], 0
+        shard.append(record)
+        size += size_of_record
+    if shard:
+        shards.append(shard)
+    return shards
+
+class HashingWriter:
+    '''
+    File wrapper that hashes everything written through it
+    '''
+    def __init__(self, f):
+        self.f = f
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self.f.write(data)
+
+def write_shard(output, number, records):
+    '''
+    Write one shard and its part of the index, in a worker process
+    The shard is written under a temporary name and renamed once complete.
+    Returns (shard name, SHA-256 of the shard, samples written, paths that failed)
+    '''
+    name = shard_name(number)
+    part_path = os.path.join(output, f'shard-{number:05d}.part')
+    entries, failed = [], []
+    with open(part_path, 'wb') as f:
+        writer = HashingWriter(f)
+        with tarfile.open(fileobj=writer, mode='w|', format=tarfile.PAX_FORMAT) as tar:
+            for record in records:
+                try:
+                    members = [('jpg', read_file(record['normal']))]
+                    if record['debug']:
+                        members.append(('debug.jpg', read_file(record['debug'])))
+                except OSError as e:
+                    print(f"Failed to export {record['normal']}: {e}", file=sys.stderr)
+                    failed.append(record['normal'])
+                    continue
+                metadata = sample_metadata(record)
+                members.append(('json', json.dumps(metadata).encode()))
+                entry = dict(metadata, shard=name, members={})
+                for suffix, data in members:
+                    info = tarfile.TarInfo(f"{record['key']}.{suffix}")
+                    info.size = len(data)
+                    info.mtime = record['mtime']
+                    info.mode = 0o644
+                    tar.addfile(info, io.BytesIO(data))
+                    # The data was just written and padded to whole blocks
+                    entry['members'][suffix] = {'offset': tar.offset - padded(len(data)), 'size': len(data),
+                                                'sha256': hashlib.sha256(data).hexdigest()}
+                entries.append(entry)
+        f.flush()
+        os.fsync(f.fileno())
+    with open(os.path.join(output, f'shard-{number:05d}.jsonl'), 'w') as f:
+        f.writelines(json.dumps(entry) + '\n' for entry in entries)
+    os.replace(part_path, os.path.join(output, name))
+    return name, writer.sha256.hexdigest(), len(entries), failed
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def load_plan(output, folder, shard_bytes, replan=False):
+    '''
+    Return the stored shard plan for output, or make and store a new one
+    '''
+    os.makedirs(output, exist_ok=True)
+    plan_path = os.path.join(output, PLAN_NAME)
+    if os.path.exists(plan_path) and not replan:
+        with open(plan_path) as f:
+            plan = json.load(f)
+        if plan['folder'] != os.path.abspath(folder):
+            raise ValueError(f"{output} holds an export of {plan['folder']}")
+        print(f"Resuming the export planned at {time.ctime(plan['created'])}, "
+              f"use --replan to include labels given since", file=sys.stderr)
+        return plan
+
+    # Shards of an earlier plan would be mixed up with the new ones
+    for name in os.listdir(output):
+        if SHARD_PATTERN.match(name) or name in (DONE_NAME, INDEX_NAME, SUMS_NAME):
+            os.remove(os.path.join(output, name))
+    plan = {'folder': os.path.abspath(folder), 'shard_bytes': shard_bytes, 'created': time.time(),
+            'shards': plan_shards(collect_labelled(folder), shard_bytes)}
+    with open(plan_path + '.tmp', 'w') as f:
+        json.dump(plan, f)
+    os.replace(plan_path + '.tmp', plan_path)
+    return plan
+
+def finished_shards(output):
+    '''
+    Shards recorded as done whose file is still there, by name
+    '''
+    done = {}
+    path = os.path.join(output, DONE_NAME)
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    shard = json.loads(line)
+                except ValueError:
+                    break  # Torn write at the end of the file
+                if os.path.exists(os.path.join(output, shard['shard'])):
+                    done[shard['shard']] = shard
+    return done
+
+def export_shards(output, plan, workers=4, progress=None):
+    '''
+    Write the shards of a plan that are not finished yet, then the index and checksums
+    progress(samples, failed) is called as shards finish, and up front for shards an
+    earlier run finished. Returns (samples, failed) for the whole export
+    '''
+    done = finished_shards(output)
+    if progress:
+        for shard in done.values():
+            progress(shard['samples'], len(shard['failed']))
+    todo = [(number, records) for number, records in enumerate(plan['shards']) if shard_name(number) not in done]
+
+    with open(os.path.join(output, DONE_NAME), 'a') as done_file, \
+         ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(write_shard, output, number, records) for number, records in todo]
+        for future in as_completed(futures):
+            name, sha256, samples, failed = future.result()
+            done[name] = {'shard': name, 'sha256': sha256, 'samples': samples, 'failed': failed}
+            done_file.write(json.dumps(done[name]) + '\n')
+            done_file.flush()
+            os.fsync(done_file.fileno())
+            if progress:
+                progress(samples, len(failed))
+
+    # The index and checksums cover all shards in order, whichever run wrote them
+    names = [shard_name(number) for number in range(len(plan['shards']))]
+    with open(os.path.join(output, INDEX_NAME + '.tmp'), 'w') as index:
+        for name in names:
+            with open(os.path.join(output, name[:-len('.tar')] + '.jsonl')) as part:
+                index.writelines(part)
+    os.replace(os.path.join(output, INDEX_NAME + '.tmp'), os.path.join(output, INDEX_NAME))
+    with open(os.path.join(output, SUMS_NAME), 'w') as sums:
+        sums.writelines(f"{done[name]['sha256']}  {name}\n" for name in names)
+    return sum(done[name]['samples'] for name in names), sum(len(done[name]['failed']) for name in names)
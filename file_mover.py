@@ -0,0 +1,241 @@
+# file_mover.py
+import os
+import json
+import queue
+import shutil
+import threading
+from timing import tracer
+
+class FileMover:
+    '''
+    Moves labelled image pairs on a background thread
+    Every label is one action, a list of (src, dst) moves. Actions are written to an
+    append-only journal before they run and marked done afterwards, so a session
+    that died mid-move is finished on restart, and completed actions can be undone
+    in reverse order. Deleted files go to a trash folder so they can be restored,
+    until their action falls out of the undo history. An action is all or nothing:
+    when one of its moves fails the moves already made are reversed, and the action
+    is kept in failed and passed to on_failed, which runs on the worker thread.
+    Actions are tagged with owner, and recovery leaves those of other owners alone.
+    '''
+    def __init__(self, journal_path, trash_dir, max_undo=100, batch_size=32, owner=None, on_failed=None):
+        self.journal_path = journal_path
+        self.trash_dir = trash_dir
+        self.owner = owner
+        self.on_failed = on_failed
+        self.max_undo = max_undo
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.made_dirs = set()
+        self.undo_stack = []
+        self.failed = []
+        self.next_id = 1
+
+        os.makedirs(os.path.dirname(journal_path), exist_ok=True)
+        self.recover()
+        self.journal = open(journal_path, 'a')
+        self.thread = threading.Thread(target=self.run, name='file-mover', daemon=True)
+        self.thread.start()
+
+    def submit(self, moves, **info):
+        '''
+        Queue one action; a dst of None deletes src into the trash folder
+        Extra keyword arguments are stored with the action and returned by undo()
+        '''
+        with self.lock:
+            action_id = self.next_id
+            self.next_id += 1
+        moves = [(src, dst if dst else os.path.join(self.trash_dir, f'{action_id}_{os.path.basename(src)}'))
+                 for src, dst in moves]
+        self.queue.put({'id': action_id, 'moves': moves, 'info': info})
+
+    def run(self):
+        while True:
+            action = self.queue.get()
+            if action is None:
+                self.queue.task_done()
+                return
+            # Group whatever else is waiting into the same batch
+            batch = [action]
+            while len(batch) < self.batch_size:
+                try:
+                    action = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if action is None:
+                    self.queue.task_done()
+                    self.queue.put(None)
+                    break
+                batch.append(action)
+            with self.lock:
+                try:
+                    self.process_batch(batch)
+                except Exception as e:
+                    # Later labels and undo() wait on this thread, so it must not die
+                    print(f"Failed to apply actions {[action['id'] for action in batch]}: {e}")
+                    for action in batch:
+                        if 'error' not in action and action not in self.undo_stack:
+                            action['error'] = str(e)
+                            self.fail(action)
+            for _ in batch:
+                self.queue.task_done()
+
+    def process_batch(self, batch):
+        for action in batch:
+            self.write_record(self.begin_record(action), sync=False)
+        with tracer.stage('journal_sync'):
+            self.sync_journal()
+        for action in batch:
+            if self.run_action(action):
+                self.write_record({'op': 'done', 'id': action['id']}, sync=False)
+                self.undo_stack.append(action)
+            else:
+                self.write_record({'op': 'failed', 'id': action['id']}, sync=False)
+                self.fail(action)
+        self.sync_journal()
+        cut = max(0, len(self.undo_stack) - self.max_undo)
+        self.purge_trash(self.undo_stack[:cut])
+        del self.undo_stack[:cut]
+
+    def run_action(self, action):
+        '''
+        Make the moves of an action, or none of them if one fails
+        On failure the error is stored in the action and False returned
+        '''
+        done = []
+        try:
+            for src, dst in action['moves']:
+                self.apply_move(src, dst)
+                done.append((src, dst))
+        except OSError as e:
+            # e.g. the normal image could not be moved, so its debug image must not be trashed
+            print(f"Failed to move {src} to {dst}: {e}")
+            action['error'] = str(e)
+            self.reverse_moves(done)
+            return False
+        return True
+
+    def fail(self, action):
+        self.failed.append(action)
+        if self.on_failed:
+            self.on_failed(action)
+
+    def begin_record(self, action):
+        return {'op': 'begin', 'id': action['id'], 'moves': action['moves'], 'info': action['info']}
+
+    def purge_trash(self, actions):
+        # Files deleted by actions that can no longer be undone are gone for good
+        for action in actions:
+            for src, dst in action['moves']:
+                if os.path.dirname(dst) == self.trash_dir and os.path.exists(dst):
+                    os.remove(dst)
+
+    def apply_move(self, src, dst):
+        # Idempotent so that replaying the journal after a crash is safe
+        if not os.path.exists(src):
+            if not os.path.exists(dst):
+                raise FileNotFoundError(f"Cannot move missing file: {src}")
+            return
+        dest_dir = os.path.dirname(dst)
+        if dest_dir not in self.made_dirs:
+            os.makedirs(dest_dir, exist_ok=True)
+            self.made_dirs.add(dest_dir)
+        with tracer.stage('move'):
+            shutil.move(src, dst)
+
+    def undo(self):
+        '''
+        Reverse the most recent completed action and return it, or None
+        Waits for queued moves to finish first
+        '''
+        self.queue.join()
+        with self.lock:
+            if not self.undo_stack:
+                return None
+            action = self.undo_stack.pop()
+            self.write_record({'op': 'undo', 'id': action['id']})
+            self.reverse(action)
+            self.write_record({'op': 'undone', 'id': action['id']})
+        return action
+
+    def reverse(self, action):
+        self.reverse_moves(action['moves'])
+
+    def reverse_moves(self, moves):
+        for src, dst in reversed(moves):
+            try:
+                self.apply_move(dst, src)
+            except OSError as e:
+                print(f"Failed to move {dst} back to {src}: {e}")
+
+    def write_record(self, record, sync=True):
+        self.journal.write(self.record_line(record))
+        if sync:
+            self.sync_journal()
+
+    def record_line(self, record):
+        return json.dumps(dict(record, owner=self.owner)) + '\n'
+
+    def sync_journal(self):
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+
+    def recover(self):
+        '''
+        Finish actions that were interrupted and rebuild the undo history,
+        then compact the journal to the last max_undo actions
+        '''
+        actions = {}
+        states = {}
+        foreign = []
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path) as journal:
+                for line in journal:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # Torn write at the end of the journal
+                    if record.get('owner') != self.owner:
+                        # Another instance's action, only it may finish or undo it
+                        foreign.append(line)
+                        continue
+                    if record['op'] == 'begin':
+                        actions[record['id']] = {'id': record['id'], 'moves': [tuple(move) for move in record['moves']],
+                                                 'info': record.get('info', {})}
+                    states[record['id']] = record['op']
+
+        for action_id, action in actions.items():
+            state = states[action_id]
+            if state == 'begin':
+                print(f"Finishing interrupted move {action_id}")
+                if self.run_action(action):
+                    self.undo_stack.append(action)
+            elif state == 'undo':
+                print(f"Finishing interrupted undo {action_id}")
+                self.reverse(action)
+            elif state == 'done':
+                self.undo_stack.append(action)
+        self.next_id = max(actions, default=0) + 1
+
+        cut = max(0, len(self.undo_stack) - self.max_undo)
+        self.purge_trash(self.undo_stack[:cut])
+        del self.undo_stack[:cut]
+
+        temp_path = self.journal_path + '.tmp'
+        with open(temp_path, 'w') as journal:
+            journal.writelines(foreign)
+            for action in self.undo_stack:
+                journal.write(self.record_line(self.begin_record(action)))
+                journal.write(self.record_line({'op': 'done', 'id': action['id']}))
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(temp_path, self.journal_path)
+
+    def close(self):
+        '''
+        Finish all queued moves and stop the worker thread
+        '''
+        self.queue.put(None)
+        self.thread.join()
+        self.journal.close()
@@ -0,0 +1,42 @@
+# frame_cache.py
+from collections import OrderedDict
+
+class FrameCache:
+    '''
+    Least recently used cache of decoded frames, bounded by their total size in bytes
+    Values only need an nbytes attribute. Used from the UI thread only
+    '''
+    def __init__(self, max_bytes=512 * 2**20):
+        self.max_bytes = max_bytes
+        self.frames = OrderedDict()
+        self.total_bytes = 0
+
+    def __contains__(self, pair):
+        return pair in self.frames
+
+    def get(self, pair):
+        frame = self.frames.get(pair)
+        if frame is not None:
+            self.frames.move_to_end(pair)
+        return frame
+
+    def put(self, pair, frame):
+        if frame.nbytes > self.max_bytes:
+            return
+        old = self.frames.pop(pair, None)
+        if old is not None:
+            self.total_bytes -= old.nbytes
+        self.frames[pair] = frame
+        self.total_bytes += frame.nbytes
+        while self.total_bytes > self.max_bytes:
+            _, evicted = self.frames.popitem(last=False)
+            self.total_bytes -= evicted.nbytes
+
+    def discard(self, pair):
+        frame = self.frames.pop(pair, None)
+        if frame is not None:
+            self.total_bytes -= frame.nbytes
+
+    def clear(self):
+        self.frames.clear()
+        self.total_bytes = 0
@@ -0,0 +1,159 @@
+# grid_view.py
+from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QShortcut
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QImage, QPixmap, QKeySequence
+from timing import tracer
+from lazy import lazy_import
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+SELECTED_COLOR = (0, 200, 255)
+MISSING_COLOR = 40
+
+class GridReview(QDialog):
+    '''
+    Pages through the upcoming pairs as a columns x rows mosaic of thumbnails
+    Clicking a tile toggles its selection and the category buttons label every
+    selected pair. The next pages are requested ahead so paging only copies
+    thumbnails that are already in memory.
+    '''
+    def __init__(self, loader, thumbnails, apply_label, columns=3, rows=6, parent=None):
+        super().__init__(parent)
+        self.loader = loader
+        self.thumbnails = thumbnails
+        self.apply_label = apply_label
+        self.columns = columns
+        self.rows = rows
+        self.page_size = columns * rows
+        self.tile_width = thumbnails.tile_width
+        self.tile_height = thumbnails.tile_height
+        self.start = 0
+        self.selected = set()
+        self.mosaic = np.empty((rows * self.tile_height, columns * self.tile_width, 3), dtype=np.uint8)
+
+        # Thumbnails tend to arrive in bursts, redraw at most once per 30 ms
+        self.redraw_timer = QTimer(self)
+        self.redraw_timer.setSingleShot(True)
+        self.redraw_timer.setInterval(30)
+        self.redraw_timer.timeout.connect(self.render)
+        self.thumbnails.thumbnail_ready.connect(self.thumbnail_arrived)
+
+        self.initUI()
+        self.render()
+
+    def initUI(self):
+        self.setWindowTitle('Grid Review')
+
+        layout = QVBoxLayout()
+
+        self.page_label = QLabel('', self)
+        layout.addWidget(self.page_label)
+
+        self.mosaic_label = QLabel(self)
+        self.mosaic_label.setAlignment(Qt.AlignLeft | Qt.AlignTop)
+        self.mosaic_label.mousePressEvent = self.toggle_tile
+        layout.addWidget(self.mosaic_label)
+
+        row = QHBoxLayout()
+        for text, handler in [('Previous Page', self.previous_page), ('Next Page', self.next_page),
+                              ('Select All', self.select_all), ('Clear Selection', self.clear_selection)]:
+            button = QPushButton(text, self)
+            button.clicked.connect(handler)
+            row.addWidget(button)
+        layout.addLayout(row)
+
+        row = QHBoxLayout()
+        for text, category in [('Correct Single', 'correct/single'), ('Correct Double', 'correct/double'),
+                               ('imageblur', 'imageblur'), ('keypointerror', 'keypointerror')]:
+            button = QPushButton(text, self)
+            button.clicked.connect(lambda checked, category=category: self.label_selected(category))
+            row.addWidget(button)
+        layout.addLayout(row)
+
+        QShortcut(QKeySequence(Qt.Key_PageDown), self).activated.connect(self.next_page)
+        QShortcut(QKeySequence(Qt.Key_PageUp), self).activated.connect(self.previous_page)
+        QShortcut(QKeySequence.SelectAll, self).activated.connect(self.select_all)
+
+        self.setLayout(layout)
+
+    def page_pairs(self, page_start=None):
+        begin = self.loader.current_pair_index + (self.start if page_start is None else page_start)
+        return self.loader.image_pairs[begin:begin + self.page_size]
+
+    def upcoming_count(self):
+        return len(self.loader.image_pairs) - self.loader.current_pair_index
+
+    def render(self):
+        with tracer.stage('grid_page'):
+            pairs = self.page_pairs()
+            self.mosaic[:] = 0
+            for index, pair in enumerate(pairs):
+                y, x = (index // self.columns) * self.tile_height, (index % self.columns) * self.tile_width
+                tile = self.mosaic[y:y + self.tile_height, x:x + self.tile_width]
+                thumbnail = self.thumbnails.get(pair)
+                if thumbnail is None:
+                    tile[:] = MISSING_COLOR
+                else:
+                    tile[:] = thumbnail
+                if pair in self.selected:
+                    cv2.rectangle(tile, (0, 0), (self.tile_width - 1, self.tile_height - 1), SELECTED_COLOR, 4)
+
+            height, width, _ = self.mosaic.shape
+            image = QImage(self.mosaic.data, width, height, 3 * width, QImage.Format_BGR888)
+            self.mosaic_label.setPixmap(QPixmap.fromImage(image))
+
+        # Make the next two pages ahead of time and drop work for pages left behind
+        ahead = self.page_pairs(self.start + self.page_size) + self.page_pairs(self.start + 2 * self.page_size)
+        self.thumbnails.request(ahead)
+        behind = self.page_pairs(max(0, self.start - self.page_size)) if self.start else []
+        self.thumbnails.cancel_except(pairs + ahead + behind)
+
+        pages = max(1, -(-self.upcoming_count() // self.page_size))
+        self.page_label.setText(f'Page {self.start // self.page_size + 1} of {pages}, {len(self.selected)} selected')
+
+    def thumbnail_arrived(self, pair, thumbnail):
+        if pair in self.page_pairs() and not self.redraw_timer.isActive():
+            self.redraw_timer.start()
+
+    def toggle_tile(self, event):
+        column, row = event.pos().x() // self.tile_width, event.pos().y() // self.tile_height
+        if column >= self.columns or row >= self.rows:
+            return
+        pairs = self.page_pairs()
+        index = row * self.columns + column
+        if index < len(pairs):
+            self.selected ^= {pairs[index]}
+            self.render()
+
+    def next_page(self):
+        if self.start + self.page_size < self.upcoming_count():
+            self.start += self.page_size
+            self.render()
+
+    def previous_page(self):
+        if self.start:
+            self.start = max(0, self.start - self.page_size)
+            self.render()
+
+    def select_all(self):
+        self.selected.update(self.page_pairs())
+        self.render()
+
+    def clear_selection(self):
+        self.selected.clear()
+        self.render()
+
+    def label_selected(self, category):
+        if not self.selected:
+            return
+        # Keep the on-screen order so undo brings the pairs back in order
+        pairs = [pair for pair in self.loader.image_pairs[self.loader.current_pair_index:] if pair in self.selected]
+        self.apply_label(category, pairs)
+        self.selected.clear()
+        self.start = min(self.start, max(0, (self.upcoming_count() - 1) // self.page_size * self.page_size))
+        self.render()
+
+    def done(self, result):
+        self.thumbnails.cancel_except([])
+        self.thumbnails.thumbnail_ready.disconnect(self.thumbnail_arrived)
+        super().done(result)
@@ -0,0 +1,89 @@
+# history_strip.py
+from lazy import lazy_import
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+class HistoryStrip:
+    '''
+    Fixed-size view of the current pair stacked above the last `depth` pairs
+    Strips are kept in a preallocated ring buffer sized from the first frame,
+    so memory and per-frame cost stay constant however long the session runs.
+    A frame far off that size, e.g. after a small placeholder, resizes the buffer
+    '''
+    def __init__(self, depth=1):
+        self.depth = depth
+        self.strips = None
+        self.canvas = None
+        self.head = -1
+        self.count = 0
+
+    def push(self, frame):
+        '''
+        Add a frame as the newest strip and return the updated view
+        '''
+        self.fit_into(frame, self.advance(frame.shape))
+        return self.render()
+
+    def advance(self, shape):
+        '''
+        Start a new newest strip and return it so it can be filled in place
+        The buffers are allocated on first use from the given frame shape
+        '''
+        if self.strips is None or self.far_off(shape):
+            self.allocate(shape)
+
+        self.head = (self.head + 1) % len(self.strips)
+        self.count = min(self.count + 1, len(self.strips))
+        return self.strips[self.head]
+
+    def far_off(self, shape, tolerance=1.25):
+        # Small differences are letterboxed instead, so the view does not jump about
+        strip_height, strip_width = self.strips.shape[1:3]
+        height, width = shape[:2]
+        return not (strip_height / tolerance <= height <= strip_height * tolerance
+                    and strip_width / tolerance <= width <= strip_width * tolerance)
+
+    def allocate(self, shape):
+        '''
+        Size the buffers for the given frame shape, keeping the strips already shown
+        '''
+        height, width = shape[:2]
+        old_strips = self.strips
+        self.strips = np.zeros((self.depth + 1, height, width, 3), dtype=np.uint8)
+        self.canvas = np.zeros(((self.depth + 1) * height, width, 3), dtype=np.uint8)
+        if old_strips is not None:
+            for i in range(self.count):
+                slot = (self.head - i) % len(old_strips)
+                self.fit_into(old_strips[slot], self.strips[slot])
+
+    def render(self):
+        # Newest strip on top, oldest at the bottom
+        if self.depth == 0:
+            return self.strips[0]
+        strip_height = self.strips.shape[1]
+        for i in range(self.count):
+            self.canvas[i * strip_height:(i + 1) * strip_height] = self.strips[(self.head - i) % len(self.strips)]
+        return self.canvas[:self.count * strip_height]
+
+    def clear(self):
+        self.head = -1
+        self.count = 0
+
+    @staticmethod
+    def fit_into(frame, slot):
+        '''
+        Copy a frame into a strip slot, letterboxing it if the sizes differ
+        '''
+        if frame.shape == slot.shape:
+            slot[:] = frame
+            return
+
+        slot_h, slot_w, _ = slot.shape
+        h, w, _ = frame.shape
+        scaling_factor = min(slot_w / w, slot_h / h)
+        new_w = max(1, int(w * scaling_factor))
+        new_h = max(1, int(h * scaling_factor))
+        x = (slot_w - new_w) // 2
+        y = (slot_h - new_h) // 2
+        slot[:] = 0
+        cv2.resize(frame, (new_w, new_h), dst=slot[y:y + new_h, x:x + new_w])
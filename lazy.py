@@ -0,0 +1,28 @@
+# lazy.py
+import sys
+import importlib.util
+
+def lazy_import(name):
+    '''
+    Return a module that is only really imported on first attribute access
+    Keeps heavy imports like cv2 and numpy off the startup path
+    '''
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+def import_now(*modules):
+    '''
+    Finish lazy imports on the calling thread
+    The lazy loader is not thread-safe before Python 3.12, so do this before
+    handing work that uses the modules to a pool
+    '''
+    for module in modules:
+        getattr(module, '__name__')
@@ -0,0 +1,189 @@
+# leases.py
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+
+class LeaseManager:
+    '''
+    Splits the pairs of a shared folder between several running instances
+    Each instance owns one lease file listing the pairs it has claimed. Batches
+    are claimed under a lock file created with O_EXCL, so two instances never
+    claim the same pair. A heartbeat keeps the lease fresh; leases that have not
+    been touched for `ttl` seconds belong to a dead instance and are ignored.
+    Instances are named after their host and the first free slot on it, so an
+    instance restarted after a crash takes over the name, and with it the move
+    journal, of the one it replaces.
+    '''
+    def __init__(self, lease_dir, batch_size=50, ttl=120):
+        self.lease_dir = lease_dir
+        self.batch_size = batch_size
+        self.ttl = ttl
+        self.owner = None
+        self.lease_path = None
+        self.lock_path = os.path.join(lease_dir, 'claim.lock')
+        self.pairs = []
+        self.done = set()
+        self.gone = set()
+        self.state_lock = threading.Lock()
+        self.stopped = threading.Event()
+        os.makedirs(lease_dir, exist_ok=True)
+
+    def start(self):
+        '''
+        Take a name for this instance and keep its lease fresh from now on
+        '''
+        self.take_slot()
+        self.heartbeat_thread = threading.Thread(target=self.heartbeat, name='lease-heartbeat', daemon=True)
+        self.heartbeat_thread.start()
+
+    def take_slot(self):
+        host = socket.gethostname()
+        if not self.acquire_lock():
+            # Only the journal of a crashed session is missed with a unique name
+            print("Could not get the claim lock, another instance may be stuck")
+            self.set_owner(f'{host}-{os.getpid()}-{uuid.uuid4().hex[:6]}')
+            self.write_lease()
+            return
+        try:
+            slot = 1
+            while self.slot_in_use(f'{host}-{slot}'):
+                slot += 1
+            self.set_owner(f'{host}-{slot}')
+            self.write_lease()
+        finally:
+            self.release_lock()
+
+    def set_owner(self, owner):
+        self.owner = owner
+        self.lease_path = os.path.join(self.lease_dir, owner + '.lease')
+
+    def slot_in_use(self, owner):
+        path = os.path.join(self.lease_dir, owner + '.lease')
+        try:
+            if time.time() - os.stat(path).st_mtime > self.ttl:
+                return False
+            with open(path) as f:
+                pid = json.load(f).get('pid')
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError):
+            return True
+        # A lease of this host that is still fresh may have been left by a crash
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except (PermissionError, TypeError):
+            pass
+        return True
+
+    def heartbeat(self):
+        # Renew the lease well before it expires
+        while not self.stopped.wait(min(self.ttl / 3, 15)):
+            with self.state_lock:
+                self.write_lease()
+
+    def acquire_lock(self, timeout=10, stale_after=30):
+        deadline = time.time() + timeout
+        while True:
+            try:
+                os.close(os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - os.stat(self.lock_path).st_mtime > stale_after:
+                        os.remove(self.lock_path)  # Left behind by a crashed instance
+                        continue
+                except FileNotFoundError:
+                    continue
+            if time.time() > deadline:
+                return False
+            time.sleep(0.05)
+
+    def release_lock(self):
+        try:
+            os.remove(self.lock_path)
+        except FileNotFoundError:
+            pass
+
+    def claimed_by_others(self):
+        claimed = set()
+        now = time.time()
+        with os.scandir(self.lease_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.lease') or entry.path == self.lease_path:
+                    continue
+                try:
+                    if now - entry.stat().st_mtime > self.ttl:
+                        continue  # Expired, its pairs are up for grabs
+                    with open(entry.path) as f:
+                        claimed.update(json.load(f)['pairs'])
+                except (OSError, ValueError, KeyError):
+                    continue
+        return claimed
+
+    def claim(self, candidates):
+        '''
+        Claim up to batch_size pairs from candidates, in order
+        Returns the newly claimed pairs, which may be empty
+        '''
+        if not self.acquire_lock():
+            print("Could not get the claim lock, another instance may be stuck")
+            return []
+        try:
+            # Reading the other leases can be slow on NFS, don't hold up mark_done meanwhile
+            others = self.claimed_by_others()
+            with self.state_lock:
+                mine = {pair[0] for pair in self.pairs}
+                # Forget finished pairs whose files have been moved away
+                self.pairs = [pair for pair in self.pairs if pair[0] not in self.done or os.path.exists(pair[0])]
+                self.done &= {pair[0] for pair in self.pairs}
+                claimed = []
+                for pair in candidates:
+                    if len(claimed) >= self.batch_size:
+                        break
+                    key = pair[0]
+                    if key in others or key in mine or key in self.gone:
+                        continue
+                    if not os.path.exists(key):
+                        self.gone.add(key)
+                        continue
+                    claimed.append(pair)
+                self.pairs.extend(claimed)
+                self.write_lease()
+            return claimed
+        finally:
+            self.release_lock()
+
+    def mark_done(self, pair):
+        with self.state_lock:
+            self.done.add(pair[0])
+
+    def reclaim(self, pair):
+        # A pair brought back by undo stays ours
+        with self.state_lock:
+            self.done.discard(pair[0])
+            self.gone.discard(pair[0])
+            if pair not in self.pairs:
+                self.pairs.append(pair)
+            self.write_lease()
+
+    def write_lease(self):
+        temp_path = self.lease_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'owner': self.owner, 'pid': os.getpid(), 'pairs': [pair[0] for pair in self.pairs], 'done': sorted(self.done)}, f)
+        os.replace(temp_path, self.lease_path)
+
+    def release(self):
+        '''
+        Give up all claims, e.g. on exit
+        '''
+        self.stopped.set()
+        with self.state_lock:
+            try:
+                os.remove(self.lease_path)
+            except FileNotFoundError:
+                pass
@@ -1,15 +1,26 @@
 import os
-from PyQt5.QtWidgets import QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QFileDialog, QDialog, QSizePolicy, QLineEdit, QMessageBox
-from PyQt5.QtCore import Qt, QUrl
-from PyQt5.QtGui import QKeySequence, QFont, QDesktopServices
+import sys
+from PyQt5.QtWidgets import QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QFileDialog, QDialog, QSizePolicy, QLineEdit, QMessageBox, QInputDialog
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QKeySequence, QFont
 from PyQt5.QtWidgets import QShortcut
-from load_image import LoadImage
+from load_image import LoadImage, MAX_DISPLAY_WIDTH, MAX_DISPLAY_HEIGHT
 from magnifyingglass import MagnifyingGlass
 from renameDialogue import RenameDialog  # Import the RenameDialog class
+from quality_dialog import QualityDialog
+from search_dialog import SearchDialog
+from grid_view import GridReview
+from thumbnails import ThumbnailCache
+from timing import tracer
 
 class LoadUI:
-    def __init__(self, parent):
+    def __init__(self, parent, loader_options=None, magnifier_options=None, grid_options=None, folder=None):
         self.parent = parent
+        self.folder = folder
+        self.loader_options = loader_options or {}
+        self.magnifier_options = magnifier_options or {}
+        self.grid_options = grid_options or {}
+        self.thumbnails = None
         self.prev_button_pressed = []
 
     def initUI(self):
@@ -43,6 +54,17 @@ class LoadUI:
         self.next_button.clicked.connect(self.parent.load_next_image_pair)
         self.button_frame.addWidget(self.next_button)
 
+        # Going back shows already labelled pairs read-only, undo them to relabel
+        self.previous_button = QPushButton('Previous Pair', self.parent)
+        self.previous_button.clicked.connect(self.show_previous_pair)
+        self.button_frame.addWidget(self.previous_button)
+        QShortcut(QKeySequence(Qt.Key_Left), self.parent).activated.connect(self.show_previous_pair)
+        QShortcut(QKeySequence(Qt.Key_Right), self.parent).activated.connect(self.parent.load_next_image_pair)
+
+        self.goto_button = QPushButton('Go To...', self.parent)
+        self.goto_button.clicked.connect(self.go_to_pair)
+        self.button_frame.addWidget(self.goto_button)
+
         # self.correct_button = QPushButton('Correct', self.parent)
         # self.correct_button.clicked.connect(self.handle_correct)
         # Vertical layout for Single and Double buttons
@@ -53,6 +75,14 @@ class LoadUI:
         self.search_button = QPushButton('Search File', self.parent)
         self.search_button.clicked.connect(self.perform_search)
         self.button_frame.addWidget(self.search_button)
+
+        self.quality_button = QPushButton('Quality', self.parent)
+        self.quality_button.clicked.connect(self.open_quality_dialog)
+        self.button_frame.addWidget(self.quality_button)
+
+        self.grid_button = QPushButton('Grid Review', self.parent)
+        self.grid_button.clicked.connect(self.open_grid_review)
+        self.button_frame.addWidget(self.grid_button)
         
         self.single_button = QPushButton('Correct Single', self.parent)  # Correctly define single_button here
         self.single_button.clicked.connect(self.handle_correct_single)
@@ -82,30 +112,46 @@ class LoadUI:
         self.incorrect_keypoint_error_button.clicked.connect(self.handle_keypoint_error)  # Update the connection
         self.button_frame.addWidget(self.incorrect_keypoint_error_button)
         
-        # self.undo_button = QPushButton('Delete Previous', self.parent)
-        # self.undo_button.clicked.connect(self.handle_delete)
-        # self.button_frame.addWidget(self.undo_button)
+        self.undo_button = QPushButton('Undo Previous', self.parent)
+        self.undo_button.clicked.connect(self.handle_delete)
+        self.button_frame.addWidget(self.undo_button)
+        QShortcut(QKeySequence.Undo, self.parent).activated.connect(self.handle_delete)
 
         self.image_label = QLabel(self.parent)
         self.image_label.setAlignment(Qt.AlignCenter)
 
+        # Live latency percentiles, toggled with F12 or --timing
+        self.stats_label = QLabel('', self.parent)
+        self.stats_label.setAlignment(Qt.AlignCenter)
+        self.stats_label.setVisible(tracer.enabled)
+        self.stats_timer = QTimer(self.parent)
+        self.stats_timer.timeout.connect(self.update_stats)
+        self.stats_timer.start(1000)
+        QShortcut(QKeySequence('F12'), self.parent).activated.connect(self.toggle_timing)
+
         layout = QVBoxLayout()
         layout.addWidget(self.label)
         layout.addWidget(self.remaining_label)
         layout.addWidget(self.completed_label)
         layout.addLayout(self.button_frame)  # Add button_frame (QVBoxLayout) to the main layout
+        layout.addWidget(self.stats_label)
         layout.addWidget(self.image_label)
 
         self.parent.setLayout(layout)
 
-        self.image_files = QFileDialog.getExistingDirectory(self.parent, "Select Folder with Images")
-        self.loader = LoadImage(self.image_files, self.image_label, self.label, self.remaining_label, self.completed_label, self.prev_lpid)
-        self.magnifier = MagnifyingGlass(self.loader)
+        self.image_files = self.folder or QFileDialog.getExistingDirectory(self.parent, "Select Folder with Images")
+        if not self.image_files:
+            # Cancelled, there is nothing to label and no folder to keep state in
+            print("No folder selected, exiting")
+            sys.exit(0)
+        self.loader = LoadImage(self.image_files, self.image_label, self.label, self.remaining_label, self.completed_label, self.prev_lpid, **self.loader_options)
+        self.magnifier = MagnifyingGlass(self.loader, **self.magnifier_options)
         self.loader.magnifier = self.magnifier
 
         self.parent.loader = self.loader  # Ensure the loader attribute is set on the parent
         self.assign_methods_to_parent()
 
+        self.quality_button.setEnabled(self.loader.quality is not None)
         self.update_counts()
         # self.initShortcuts()
         self.parent.setMouseTracking(True)
@@ -121,6 +167,18 @@ class LoadUI:
     def update_counts(self):
         self.loader.update_counts()
 
+    def toggle_timing(self):
+        if tracer.enabled:
+            tracer.disable()
+        else:
+            tracer.enable()
+        self.stats_label.setVisible(tracer.enabled)
+        self.update_stats()
+
+    def update_stats(self):
+        if tracer.enabled:
+            self.stats_label.setText(tracer.summary(['label', 'compose_sync', 'decode', 'qpixmap', 'magnifier', 'move']))
+
     # def initShortcuts(self):
     #     QShortcut(QKeySequence('1'), self.parent).activated.connect(self.handle_correct)
     #     QShortcut(QKeySequence('2'), self.parent).activated.connect(self.handle_correct_single)
@@ -138,8 +196,40 @@ class LoadUI:
             if new_name:
                 self.parent.loader.move_image_without_creating_folders(category, new_name)
 
-    def perform_search(self, dialog):
-        QDesktopServices.openUrl(QUrl.fromLocalFile("/home/student/Desktop/LPR_Annotation/lpr_alert_techplace1/media/peseyes/output/lpr_alert/"))
+    def open_quality_dialog(self):
+        dialog = QualityDialog(self.loader, self.parent)
+        dialog.exec_()
+        dialog.deleteLater()
+
+    def open_grid_review(self):
+        columns, rows = self.grid_options.get('columns', 3), self.grid_options.get('rows', 6)
+        if self.thumbnails is None:
+            # Kept for the whole session so reopening the grid starts from warm thumbnails
+            self.thumbnails = ThumbnailCache(MAX_DISPLAY_WIDTH // columns, MAX_DISPLAY_HEIGHT // rows,
+                                             cache_dir=self.loader_options.get('preview_cache_dir'))
+        GridReview(self.loader, self.thumbnails, self.handle_grid_label, columns, rows, self.parent).exec_()
+
+    def shutdown(self):
+        if self.thumbnails:
+            self.thumbnails.shutdown()
+        self.loader.shutdown()
+
+    def handle_grid_label(self, category, pairs):
+        self.prev_button_pressed.extend([category] * len(pairs))
+        self.parent.loader.label_pairs(pairs, category)
+
+    def show_previous_pair(self):
+        self.loader.show_previous_pair()
+
+    def go_to_pair(self):
+        shown = self.loader.shown_index()
+        number, ok = QInputDialog.getInt(self.parent, 'Go To Pair', f'Pair number (1 to {len(self.loader.image_pairs)}):',
+                                         1 if shown is None else shown + 1, 1, max(1, len(self.loader.image_pairs)))
+        if ok:
+            self.loader.show_pair_at(number - 1)
+
+    def perform_search(self):
+        SearchDialog(self.loader, self.parent).exec_()
 
     
     def handle_keypoint_error(self):
@@ -168,20 +258,10 @@ class LoadUI:
         self.prev_button_pressed.append('wrong/double')
         self.parent.rename_and_move_image('wrong/double')
     
-    # def handle_delete(self):
-    #     if self.prev_button_pressed:
-    #         last_action = self.prev_button_pressed.pop()
-    #         print(last_action)
-    #         if last_action == 'keypointerror':
-    #             return None
-    #         elif last_action == 'correct/single':
-    #             return None
-    #         elif last_action == 'correct/double':
-    #             return None
-    #         elif last_action == 'imageblur':
-    #             return None
-    #         elif last_action == 'wrong/single':
-    #             return None
-    #         elif last_action == 'wrong/double':
-    #             return None
-
+    def handle_delete(self):
+        # Undo the previous label using the move journal
+        category = self.parent.loader.undo_last()
+        if category is not None:
+            if self.prev_button_pressed:
+                self.prev_button_pressed.pop()
+            print(f"Undid {category}")
@@ -1,15 +1,285 @@
 import re
 import os
-import cv2
-import shutil
-import numpy as np
+import struct
+import threading
+import itertools
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
 from PyQt5.QtGui import QImage, QPixmap
+from prefetch import FramePrefetcher
+from history_strip import HistoryStrip
+from frame_cache import FrameCache
+from pair_index import PairIndex, pair_sort_key
+from preview_cache import PreviewCache
+from file_mover import FileMover
+from manifest import LabelManifest, manifest_path
+from timing import tracer
+from leases import LeaseManager
+from quality import QualityScorer
+from bursts import group_bursts
+from metadata_index import MetadataIndex, PENDING
+from lazy import lazy_import, import_now
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+MAX_DISPLAY_WIDTH = 1330
+MAX_DISPLAY_HEIGHT = 756
+
+# Folders created by the move functions, never scanned for new pairs
+OUTPUT_DIRS = ('correct', 'wrong', 'imageblur', 'keypointerror', 'ignore', 'doubleline', 'others')
+
+# Per-folder state such as the move journal lives in this hidden folder
+STATE_DIR = '.autolabeller'
+
+# How the move functions lay out a labelled pair
+MOVE_SPLIT = 'split'    # category/normal and category/debug
+MOVE_NORMAL = 'normal'  # normal image into category, debug image deleted
+MOVE_BOTH = 'both'      # both images into category
+
+IDENTIFIER_PATTERN = re.compile(r'(\d{4}_\d{2}_\d{2}_\d{2}_\d{2}_\d{2}_lpr[A-Z0-9]+)(_debug)?\.jpg')
+
+# Layout used by each label button in LoadUI
+CATEGORY_LAYOUTS = {
+    'correct/single': MOVE_NORMAL,
+    'correct/double': MOVE_NORMAL,
+    'imageblur': MOVE_NORMAL,
+    'wrong/single': MOVE_NORMAL,
+    'wrong/double': MOVE_NORMAL,
+    'keypointerror': MOVE_BOTH,
+}
+
+
+# JPEG frame markers that carry the image size (SOF0-SOF15 minus DHT, JPG and DAC)
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# libjpeg can scale by 1/2, 1/4 or 1/8 while decoding
+REDUCED_DECODE_FLAGS = {
+    1: 'IMREAD_COLOR',
+    2: 'IMREAD_REDUCED_COLOR_2',
+    4: 'IMREAD_REDUCED_COLOR_4',
+    8: 'IMREAD_REDUCED_COLOR_8',
+}
+
+
+def read_jpeg_size(data):
+    '''
+    Return (height, width) from the frame header of an encoded JPEG, or None
+    '''
+    view = memoryview(data).cast('B')
+    if len(view) < 4 or view[0] != 0xFF or view[1] != 0xD8:
+        return None
+    i = 2
+    while i + 4 <= len(view):
+        if view[i] != 0xFF:
+            return None
+        code = view[i + 1]
+        if code == 0xFF:  # Fill byte
+            i += 1
+            continue
+        if code == 0x01 or 0xD0 <= code <= 0xD7:  # Markers without a payload
+            i += 2
+            continue
+        length = struct.unpack_from('>H', view, i + 2)[0]
+        if code in SOF_MARKERS:
+            if i + 9 > len(view):
+                return None
+            height, width = struct.unpack_from('>HH', view, i + 5)
+            return height, width
+        i += 2 + length
+    return None
+
+
+def choose_reductions(size_1, size_2):
+    '''
+    Pick the largest decode reduction for each image that still leaves at least
+    as many pixels as the composed pair will show on screen
+    '''
+    if size_1 is None or size_2 is None or 0 in size_1 or 0 in size_2:
+        return 1, 1
+    (h_1, w_1), (h_2, w_2) = size_1, size_2
+    height = max(h_1, h_2)
+    width = w_1 * height / h_1 + w_2 * height / h_2
+    display_height = height * min(1, MAX_DISPLAY_WIDTH / width, MAX_DISPLAY_HEIGHT / height)
+    reductions = []
+    for source_height in (h_1, h_2):
+        limit = source_height / display_height
+        reductions.append(max(r for r in REDUCED_DECODE_FLAGS if r <= limit) if limit >= 1 else 1)
+    return tuple(reductions)
+
+
+def decode_image(data, reduction=1):
+    if data is None or data.size == 0:
+        return None
+    return cv2.imdecode(data, getattr(cv2, REDUCED_DECODE_FLAGS[reduction]))
+
+
+# Each thread reuses two growable read buffers, one per image of a pair
+read_buffers = threading.local()
+
+
+def read_image_data(path, slot=0):
+    '''
+    Read a file into a reused per-thread buffer
+    The returned array is only valid until the next read into the same slot
+    '''
+    buffers = getattr(read_buffers, 'buffers', None)
+    if buffers is None:
+        buffers = read_buffers.buffers = [bytearray(), bytearray()]
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if len(buffers[slot]) < size:
+                buffers[slot] = bytearray(size + size // 4)
+            length = f.readinto(memoryview(buffers[slot])[:size])
+    except OSError:
+        return None
+    return np.frombuffer(buffers[slot], dtype=np.uint8, count=length)
+
+
+def plan_moves(layout, image_files, category, new_name, path_1, path_2):
+    '''
+    List the (src, dst) moves that label a pair; a dst of None deletes src
+    '''
+    if layout == MOVE_SPLIT:
+        normal_new_path = os.path.join(image_files, category, "normal", (new_name + '.jpg') if new_name else os.path.basename(path_1))
+        debug_new_path = os.path.join(image_files, category, "debug", (new_name + '_debug.jpg') if new_name else os.path.basename(path_2))
+        return [(path_1, normal_new_path), (path_2, debug_new_path)]
+
+    dest_dir = os.path.join(image_files, category)
+    normal_new_path = os.path.join(dest_dir, (new_name + '.jpg') if new_name else os.path.basename(path_1))
+    if layout == MOVE_NORMAL:
+        return [(path_1, normal_new_path), (path_2, None)]
+    debug_new_path = os.path.join(dest_dir, (new_name + '_debug.jpg') if new_name else os.path.basename(path_2))
+    return [(path_1, normal_new_path), (path_2, debug_new_path)]
+
+
+def decode_pair(path_1, path_2, reduced_decode=True):
+    '''
+    Decode both images of a pair in OpenCV's BGR order
+    With reduced_decode the JPEGs are decoded at 1/2, 1/4 or 1/8 scale when
+    the display would throw those pixels away anyway
+    '''
+    with tracer.stage('read'):
+        data_1 = read_image_data(path_1, 0)
+        data_2 = read_image_data(path_2, 1)
+    reduction_1, reduction_2 = 1, 1
+    if reduced_decode and data_1 is not None and data_2 is not None:
+        reduction_1, reduction_2 = choose_reductions(read_jpeg_size(data_1), read_jpeg_size(data_2))
+
+    with tracer.stage('decode'):
+        # Load first image
+        image_1 = decode_image(data_1, reduction_1)
+        if image_1 is None:
+            print(f"Failed to load image: {path_1}")
+            image_1 = np.zeros((100, 100, 3), dtype=np.uint8)  # Placeholder for missing image
+
+        # Load second image
+        image_2 = decode_image(data_2, reduction_2)
+        if image_2 is None:
+            print(f"Failed to load image: {path_2}")
+            image_2 = np.zeros((100, 100, 3), dtype=np.uint8)  # Placeholder for missing image
+    return image_1, image_2
+
+
+def composed_size(image_1, image_2):
+    '''
+    (height, width) of the side-by-side frame: both images at the same height,
+    scaled to fit within MAX_DISPLAY_WIDTH x MAX_DISPLAY_HEIGHT
+    '''
+    return composed_shape(image_1.shape, image_2.shape)
+
+
+def composed_shape(shape_1, shape_2):
+    '''
+    composed_size from the images' shapes, for when only their sizes are known
+    '''
+    height = max(shape_1[0], shape_2[0])
+    width = int(shape_1[1] * height / shape_1[0]) + int(shape_2[1] * height / shape_2[0])
+    if height > MAX_DISPLAY_HEIGHT or width > MAX_DISPLAY_WIDTH:
+        scaling_factor = min(MAX_DISPLAY_WIDTH / width, MAX_DISPLAY_HEIGHT / height)
+        return int(height * scaling_factor), int(width * scaling_factor)
+    return height, width
+
+
+def compose_into(image_1, image_2, out):
+    '''
+    Resize both images straight into their halves of out, debug image on the left
+    Letterboxes the pair if out was sized for a different aspect ratio
+    '''
+    out_h, out_w, _ = out.shape
+    (x, y, left, h), (_, _, right, _) = pair_layout(image_1.shape, image_2.shape, out_h, out_w)
+    if (h, left + right) != (out_h, out_w):
+        out[:] = 0
+    with tracer.stage('resize'):
+        cv2.resize(image_2, (left, h), dst=out[y:y + h, x:x + left])
+        cv2.resize(image_1, (right, h), dst=out[y:y + h, x + left:x + left + right])
+    return out
+
+
+def pair_layout(shape_1, shape_2, out_h, out_w):
+    '''
+    Where compose_into puts the images of a pair in an out_h x out_w frame
+    Returns (x, y, width, height) of the debug image and then of the normal image
+    '''
+    h, w = composed_shape(shape_1, shape_2)
+    if (h, w) != (out_h, out_w):
+        scaling_factor = min(out_w / w, out_h / h)
+        h, w = max(1, int(h * scaling_factor)), max(2, int(w * scaling_factor))
+    y, x = (out_h - h) // 2, (out_w - w) // 2
+
+    # Split the width by each image's aspect ratio
+    aspect_1 = shape_1[1] / shape_1[0]
+    aspect_2 = shape_2[1] / shape_2[0]
+    left = min(w - 1, max(1, round(w * aspect_2 / (aspect_1 + aspect_2))))
+    return (x, y, left, h), (x + left, y, w - left, h)
+
+
+def compose_pair(path_1, path_2, reduced_decode=True):
+    '''
+    Decode an image pair and place it side by side, scaled to fit the display
+    The frame is in BGR order. Safe to call from worker threads.
+    '''
+    image_1, image_2 = decode_pair(path_1, path_2, reduced_decode)
+    return compose_into(image_1, image_2, np.empty(composed_size(image_1, image_2) + (3,), dtype=np.uint8))
+
+
+class BackgroundScan(QObject):
+    '''
+    Runs a folder scan on its own thread and hands the result to the UI thread through done,
+    or the exception it raised through failed
+    '''
+    done = pyqtSignal(object)
+    failed = pyqtSignal(object)
+
+    def __init__(self, scan):
+        super().__init__()
+        self.thread = threading.Thread(target=self.run, args=(scan,), name='pair-scan', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def run(self, scan):
+        try:
+            result = scan()
+        except Exception as e:
+            print(f"Background scan failed: {e}")
+            self.failed.emit(e)
+            return
+        self.done.emit(result)
+
+
+class MoveFailures(QObject):
+    '''
+    Hands labels the file mover could not apply to the UI thread
+    '''
+    failed = pyqtSignal(object)
+
 
 class LoadImage:
     
-    universal_stack = []
-    
-    def __init__(self, image_files, image_label, label, remaining_label, completed_label, prev_lpid):
+    def __init__(self, image_files, image_label, label, remaining_label, completed_label, prev_lpid, prefetch_depth=8, prefetch_workers=4, history_depth=1,
+                 recursive=False, watch_interval=5, preview_cache_dir=None, preview_cache_bytes=2 * 2**30, max_undo=100,
+                 output_mode='move', shared=False, lease_batch=50, lease_ttl=120, quality_workers=4,
+                 burst_window=0, burst_hash_distance=None, background_scan=False, frame_cache_bytes=512 * 2**20):
         self.image_files = image_files
         self.image_label = image_label
         self.label = label
@@ -17,176 +287,682 @@ class LoadImage:
         self.completed_label = completed_label
         self.magnifier = None
         
-        self.image_pairs = self.find_image_pairs()
+        # When several reviewers share the folder, only work on pairs this instance has claimed
+        state_dir = os.path.join(image_files, STATE_DIR)
+        self.leases = None
+        self.folder_remaining = None
+        instance_dir = state_dir
+        if shared:
+            self.all_pairs = []
+            self.leases = LeaseManager(os.path.join(state_dir, 'leases'), lease_batch, lease_ttl)
+            self.leases.start()
+            # Every instance keeps its own journal, trash and scores, undo only reverts its own labels
+            instance_dir = os.path.join(state_dir, self.leases.owner)
+
+        # Finish moves from an interrupted session before looking for pairs
+        self.move_failures = MoveFailures()
+        self.move_failures.failed.connect(self.move_failed)
+        self.mover = FileMover(os.path.join(instance_dir, 'journal.jsonl'), os.path.join(instance_dir, 'trash'), max_undo,
+                               owner=self.leases.owner if self.leases else None, on_failed=self.move_failures.failed.emit)
+
+        # In label-only mode decisions go to a manifest and files stay where they are
+        self.manifest = LabelManifest(manifest_path(image_files), image_files) if output_mode == 'manifest' else None
+
+        # Consecutive captures of the same plate are shown and labelled as one burst
+        self.burst_window = burst_window
+        self.burst_hash_distance = burst_hash_distance
+        self.bursts = {}
+
+        self.pair_index = PairIndex(image_files, recursive, OUTPUT_DIRS)
+        self.image_pairs = []
+        self.claiming = None
+        self.load_when_claimed = False
         self.current_pair_index = 0
         self.current_image_path_1 = None
         self.current_image_path_2 = None
-        self.completed_count = 0
+        self.completed_count = self.manifest.count() if self.manifest else 0
         self.create_combined_image = None
-        self.prev_combined_image = None
+        self.history = HistoryStrip(history_depth)
         self.prev_lpid = prev_lpid
+        self.previous_identifier = None
+        # Pairs labelled this session; they stay in the queue so navigation can go back to them
+        self.labels = {}
+        self.frame_cache = FrameCache(frame_cache_bytes) if frame_cache_bytes > 0 else None
+        self.preview_cache = None
+        if preview_cache_dir:
+            version = f'{MAX_DISPLAY_WIDTH}x{MAX_DISPLAY_HEIGHT}'
+            self.preview_cache = PreviewCache(preview_cache_dir, preview_cache_bytes, version=version)
+        self.prefetcher = FramePrefetcher(self.compose_cached, prefetch_depth, prefetch_workers) if prefetch_depth > 0 else None
+
+        # Poll for new captures, inotify does not see files written by other NFS clients
+        self.watch_timer = None
+        self.poll = None
+        if watch_interval > 0:
+            self.watch_timer = QTimer()
+            self.watch_timer.setInterval(int(watch_interval * 1000))
+            self.watch_timer.timeout.connect(self.poll_new_pairs)
+
+        # Sharpness and exposure scores for sorting, filtering and routing blurry frames
+        self.hidden_pairs = []
+        self.quality = None
+        if quality_workers > 0:
+            self.quality = QualityScorer(os.path.join(instance_dir, 'quality.sqlite'), image_files, quality_workers)
+
+        # Search index over pending and labelled captures, built in the background after the scan
+        self.metadata = None
+        self.metadata_build = None
+        self.metadata_stale = False
+        self.metadata_updates = []
+
+        # With background_scan the window is usable while a big folder is still being listed
+        self.scanning = True
+        self.load_when_scanned = False
+        labelled = self.manifest.labelled_paths() if self.manifest else None
+        if background_scan:
+            self.scan = BackgroundScan(lambda: self.scan_pairs(labelled))
+            self.scan.done.connect(self.pairs_scanned)
+            self.scan.failed.connect(self.scan_failed)
+            self.scan.start()
+        else:
+            self.pairs_scanned(self.scan_pairs(labelled))
         
-    def find_image_pairs(self):
-        files = os.listdir(self.image_files)
-        base_files = set(f.replace("_debug", "") for f in files if "_debug" not in f)
-        pairs = [(os.path.join(self.image_files, f), os.path.join(self.image_files, f.replace(".jpg", "_debug.jpg")))
-                 for f in base_files if f.replace(".jpg", "_debug.jpg") in files]
+    def find_image_pairs(self, labelled=None):
+        pairs = self.pair_index.build()
+        if self.manifest:
+            # Resume where the last label-only session stopped
+            if labelled is None:
+                labelled = self.manifest.labelled_paths()
+            pairs = [pair for pair in pairs if pair[0] not in labelled]
         return pairs
 
+    def scan_pairs(self, labelled=None):
+        '''
+        Find, group and claim the pairs to review; may run on the scan thread
+        Returns all pairs found and the ones this instance will show
+        '''
+        # Decoding starts on worker pools once the scan is done, finish the lazy imports first
+        import_now(cv2, np)
+        pairs = self.group_pairs(self.find_image_pairs(labelled))
+        return pairs, self.leases.claim(pairs) if self.leases else pairs
+
+    def pairs_scanned(self, result):
+        pairs, self.image_pairs = result
+        self.scanning = False
+        if self.leases:
+            self.all_pairs = pairs
+            self.folder_remaining = self.pair_index.count()
+        if self.quality:
+            self.quality.score(pairs)
+        if self.watch_timer:
+            self.watch_timer.start()
+        self.prefetch_upcoming()
+        self.update_counts()
+        # An index built while scanning only has the labelled pairs
+        self.metadata_stale = True
+        self.build_metadata_index()
+        if self.load_when_scanned:
+            self.load_next_image_pair()
+
+    def scan_failed(self, error):
+        # Carry on with an empty queue, polling finds the pairs once the folder can be read
+        self.pair_index.clear()
+        self.pairs_scanned(([], []))
+        self.label.setText(f'Could not scan the folder: {error}')
+
+    def metadata_entries(self, pending, labelled):
+        '''
+        List (path_1, path_2, status) for the search index; may run on a worker thread
+        In move mode labelled pairs are found in the category folders
+        '''
+        entries = [(path_1, path_2, PENDING) for path_1, path_2 in pending]
+        if labelled is not None:
+            return entries + labelled
+        for category in OUTPUT_DIRS:
+            for dirpath, dirnames, filenames in os.walk(os.path.join(self.image_files, category)):
+                status = os.path.relpath(dirpath, self.image_files)
+                if os.path.basename(status) in ('normal', 'debug'):
+                    status = os.path.dirname(status)
+                entries.extend((os.path.join(dirpath, name), '', status) for name in filenames
+                               if name.endswith('.jpg') and not name.endswith('_debug.jpg'))
+        return entries
+
+    def build_metadata_index(self):
+        '''
+        (Re)build the search index in the background unless it is current
+        '''
+        if self.metadata_build or (self.metadata is not None and not self.metadata_stale):
+            return
+        if self.scanning:
+            # pairs_scanned builds it; numpy may also still be loading on the scan thread
+            return
+        labelled = self.manifest.labels() if self.manifest else None
+        pending = [member for pair in (self.all_pairs if self.leases else self.image_pairs) for member in self.burst_members(pair)]
+        self.metadata_stale = False
+        self.metadata_updates = []
+        self.metadata_build = BackgroundScan(lambda: MetadataIndex(self.metadata_entries(pending, labelled)))
+        self.metadata_build.done.connect(self.metadata_built)
+        self.metadata_build.failed.connect(self.metadata_failed)
+        self.metadata_build.start()
+
+    def metadata_built(self, index):
+        # Labels given while the index was being built
+        for path_1, status in self.metadata_updates:
+            index.set_status(path_1, status)
+        self.metadata = index
+        self.metadata_build = None
+        if self.metadata_stale:
+            # Pairs arrived while this index was being built
+            self.build_metadata_index()
+
+    def metadata_failed(self, error):
+        # Search keeps the previous index, the next poll that finds pairs tries again
+        self.metadata_build = None
+        self.metadata_stale = True
+
+    def set_metadata_status(self, pair, status):
+        for member in self.burst_members(pair):
+            if self.metadata:
+                self.metadata.set_status(member[0], status)
+            if self.metadata_build:
+                self.metadata_updates.append((member[0], status))
+
+    def poll_new_pairs(self):
+        '''
+        Look for pairs that arrived since the last scan on a worker thread
+        Relisting a big folder takes long enough to stall the UI
+        '''
+        if self.poll is not None:
+            return  # The previous poll is still running
+        self.poll = BackgroundScan(lambda: (self.cluster_pairs(self.pair_index.refresh()), self.pair_index.count()))
+        self.poll.done.connect(self.new_pairs_found)
+        self.poll.failed.connect(self.poll_failed)
+        self.poll.start()
+
+    def new_pairs_found(self, result):
+        '''
+        Append the pairs a poll found to the end of the queue
+        '''
+        self.poll = None
+        clusters, self.folder_remaining = result
+        new_pairs = self.record_bursts(clusters)
+        if new_pairs:
+            print(f"Found {len(new_pairs)} new image pairs")
+            (self.all_pairs if self.leases else self.image_pairs).extend(new_pairs)
+            if self.quality:
+                self.quality.score(new_pairs)
+            self.metadata_stale = True
+            self.prefetch_upcoming()
+        # Other instances may have labelled pairs, which changes the folder count
+        self.update_counts()
+        return new_pairs
+
+    def poll_failed(self, error):
+        # The next timeout polls again
+        self.poll = None
+        self.label.setText(f'Could not look for new pairs: {error}')
+
+    def group_pairs(self, pairs):
+        '''
+        Collapse bursts into their first pair and remember the rest of each burst
+        A burst that straddles two folder scans ends up as two bursts
+        '''
+        if not self.burst_window:
+            return pairs
+        return self.record_bursts(self.cluster_pairs(pairs))
+
+    def cluster_pairs(self, pairs):
+        # Only reads settings, so it can run on a worker thread
+        if not self.burst_window:
+            return [[pair] for pair in pairs]
+        return group_bursts(pairs, self.burst_window, self.burst_hash_distance)
+
+    def record_bursts(self, clusters):
+        for members in clusters:
+            if len(members) > 1:
+                self.bursts[members[0][0]] = members
+        return [members[0] for members in clusters]
+
+    def burst_members(self, pair):
+        return self.bursts.get(pair[0], [pair])
+
+    def compose_cached(self, path_1, path_2):
+        '''
+        compose_pair backed by the on-disk preview cache
+        On a hit the original JPEGs are only stat'ed, never read
+        '''
+        key, frame = self.cached_preview(path_1, path_2)
+        if frame is not None:
+            return frame
+        frame = compose_pair(path_1, path_2)
+        if key:
+            with tracer.stage('preview_cache_put'):
+                self.preview_cache.put(key, frame)
+        return frame
+
+    def cached_preview(self, path_1, path_2):
+        '''
+        Return the preview cache key for a pair and its cached frame, if any
+        '''
+        if not self.preview_cache:
+            return None, None
+        key = self.preview_cache.key(path_1, path_2)
+        if not key:
+            return None, None
+        with tracer.stage('preview_cache_get'):
+            return key, self.preview_cache.get(key)
+
+    def compose_into_history(self, path_1, path_2):
+        '''
+        Synchronous path: decode and resize straight into the next history strip
+        The caches get the frame as composed, never letterboxed to the strip's size
+        '''
+        key, frame = self.cached_preview(path_1, path_2)
+        if frame is not None:
+            if self.frame_cache:
+                self.frame_cache.put((path_1, path_2), frame)
+            return self.history.push(frame)
+        image_1, image_2 = decode_pair(path_1, path_2)
+        shape = composed_size(image_1, image_2) + (3,)
+        slot = self.history.advance(shape)
+        if slot.shape == shape:
+            frame = compose_into(image_1, image_2, slot)
+            # The slot is reused by later pairs, so the frame cache needs its own copy
+            cached = slot.copy() if self.frame_cache else None
+        else:
+            frame = cached = compose_into(image_1, image_2, np.empty(shape, dtype=np.uint8))
+            HistoryStrip.fit_into(frame, slot)
+        if key:
+            with tracer.stage('preview_cache_put'):
+                self.preview_cache.put(key, frame)
+        if self.frame_cache:
+            self.frame_cache.put((path_1, path_2), cached)
+        return self.history.render()
+
+    def set_upcoming(self, pairs):
+        '''
+        Replace the pairs still to come, e.g. after reordering or filtering
+        Background work for pairs that are no longer coming up is cancelled
+        '''
+        self.image_pairs[self.current_pair_index:] = pairs
+        self.prefetch_upcoming()
+        self.update_counts()
+
+    def sort_queue(self, feature=None, descending=False):
+        '''
+        Reorder the pairs still to come by a quality feature, or by capture time
+        Pairs that have not been scored yet go last
+        '''
+        upcoming = self.image_pairs[self.current_pair_index:]
+        if feature and self.quality:
+            scored = [pair for pair in upcoming if self.quality.get(pair, feature) is not None]
+            unscored = [pair for pair in upcoming if self.quality.get(pair, feature) is None]
+            scored.sort(key=lambda pair: self.quality.get(pair, feature), reverse=descending)
+            upcoming = scored + unscored
+        else:
+            upcoming.sort(key=pair_sort_key)
+        self.set_upcoming(upcoming)
+
+    def filter_queue(self, feature, low=None, high=None):
+        '''
+        Hide upcoming pairs whose feature is outside [low, high]; unscored pairs stay
+        clear_filter() brings the hidden pairs back
+        '''
+        if not self.quality:
+            return
+        kept = []
+        for pair in self.image_pairs[self.current_pair_index:]:
+            value = self.quality.get(pair, feature)
+            if value is not None and pair not in self.labels and ((low is not None and value < low) or (high is not None and value > high)):
+                self.hidden_pairs.append(pair)
+            else:
+                kept.append(pair)
+        self.set_upcoming(kept)
+
+    def clear_filter(self):
+        hidden, self.hidden_pairs = self.hidden_pairs, []
+        self.set_upcoming(sorted(self.image_pairs[self.current_pair_index:] + hidden, key=pair_sort_key))
+
+    def pairs_below(self, threshold, feature='sharpness'):
+        '''
+        Upcoming pairs that have been scored and fall below threshold
+        '''
+        below = []
+        for pair in self.image_pairs[self.current_pair_index:] if self.quality else ():
+            value = self.quality.get(pair, feature)
+            if value is not None and value < threshold and pair not in self.labels:
+                below.append(pair)
+        return below
+
+    def route_below_threshold(self, threshold, category='imageblur', feature='sharpness'):
+        '''
+        Label every upcoming pair scoring below threshold in one pass
+        The pair currently shown is left for the reviewer. Returns the number routed
+        '''
+        routed = self.pairs_below(threshold, feature)
+        with tracer.stage('route'):
+            for pair in routed:
+                self.record_label(pair, MOVE_NORMAL, category, None)
+        self.remove_upcoming(routed)
+        print(f"Routed {len(routed)} pairs below {feature} {threshold} to {category}")
+        return len(routed)
+
+    def label_pairs(self, pairs, category, new_name=None):
+        '''
+        Label several upcoming pairs at once, e.g. from the grid view
+        Each pair is its own action, so undo brings them back one at a time
+        '''
+        layout = CATEGORY_LAYOUTS.get(category, MOVE_NORMAL)
+        pairs = [pair for pair in pairs if pair not in self.labels]
+        with tracer.stage('label'):
+            for pair in pairs:
+                self.record_label(pair, layout, category, new_name)
+        self.remove_upcoming(pairs)
+
+    def remove_upcoming(self, pairs):
+        pairs = set(pairs)
+        # Only pairs still in the queue are tracked, undo puts these back with show_now
+        for pair in pairs:
+            self.labels.pop(pair, None)
+            # Out of the queue, so going back can no longer reach its frame
+            if self.frame_cache:
+                self.frame_cache.discard(pair)
+        self.set_upcoming([pair for pair in self.image_pairs[self.current_pair_index:] if pair not in pairs])
+
+    def prefetch_upcoming(self):
+        if self.prefetcher:
+            # Skip pairs labelled earlier, they are only reached by going back and forth
+            upcoming = (self.image_pairs[index] for index in range(self.current_pair_index, len(self.image_pairs)))
+            self.prefetcher.schedule(itertools.islice((pair for pair in upcoming if pair not in self.labels), self.prefetcher.depth))
+
+    def claim_more_pairs(self):
+        '''
+        Claim another batch from the shared folder once our own claims run low
+        '''
+        if not self.leases:
+            return
+        if self.claiming is not None:
+            return
+        left = len(self.image_pairs) - self.current_pair_index
+        # Claim ahead on a worker thread, getting the claim lock can take seconds
+        if left <= max(self.prefetcher.depth if self.prefetcher else 1, self.leases.batch_size // 2):
+            candidates = list(self.all_pairs)
+            self.claiming = BackgroundScan(lambda: self.leases.claim(candidates))
+            self.claiming.done.connect(self.pairs_claimed)
+            self.claiming.failed.connect(self.claim_failed)
+            self.claiming.start()
+
+    def pairs_claimed(self, claimed):
+        self.claiming = None
+        if claimed:
+            self.image_pairs.extend(claimed)
+            self.prefetch_upcoming()
+            self.update_counts()
+        if self.load_when_claimed:
+            self.load_when_claimed = False
+            if claimed:
+                self.load_next_image_pair()
+            else:
+                self.label.setText("No More Images")
+
+    def claim_failed(self, error):
+        # The next label claims again
+        self.claiming = None
+        self.load_when_claimed = False
+        self.label.setText(f'Could not claim more pairs: {error}')
+
+    def shutdown(self):
+        if self.quality:
+            self.quality.close()
+        if self.leases:
+            self.leases.release()
+        if self.watch_timer:
+            self.watch_timer.stop()
+        if self.prefetcher:
+            self.prefetcher.shutdown()
+        if self.magnifier:
+            self.magnifier.shutdown()
+        self.mover.close()
+        if self.manifest:
+            self.manifest.close()
+        tracer.close()
+
     def load_next_image_pair(self):
+        if self.scanning:
+            # Show the first pair as soon as the folder scan finishes
+            self.load_when_scanned = True
+            self.label.setText('Scanning folder...')
+            return
+        self.claim_more_pairs()
+        if self.current_pair_index >= len(self.image_pairs) and self.claiming is not None:
+            # Show the next pair once the claim in flight comes back
+            self.load_when_claimed = True
+            self.current_image_path_1 = self.current_image_path_2 = None
+            self.label.setText('Claiming more pairs...')
+            return
         if self.current_pair_index < len(self.image_pairs):
-            if(len(self.universal_stack) > 0):
-                self.prev_lpid.setText(self.universal_stack.pop(-1))
+            if self.previous_identifier:
+                self.prev_lpid.setText(self.previous_identifier)
                 print('Previous file: ', self.prev_lpid)
-            self.current_image_path_1, self.current_image_path_2 = self.image_pairs[self.current_pair_index]
+            pair = self.image_pairs[self.current_pair_index]
+            self.current_image_path_1, self.current_image_path_2 = pair
             print(f"Loading images: {self.current_image_path_1}, {self.current_image_path_2}")
         
-            # Load first image
-            image_1 = cv2.imread(self.current_image_path_1)
-            if image_1 is not None:
-                image_1 = cv2.cvtColor(image_1, cv2.COLOR_BGR2RGB)
+            # Recently shown pairs come from the frame cache, upcoming ones from the prefetcher
+            combined_image = self.frame_cache.get(pair) if self.frame_cache else None
+            if combined_image is None and self.prefetcher:
+                with tracer.stage('prefetch_take'):
+                    combined_image = self.prefetcher.take(pair)
+                if combined_image is not None and self.frame_cache:
+                    self.frame_cache.put(pair, combined_image)
+            if combined_image is None and pair in self.labels and not self.manifest:
+                # A labelled pair's files have moved or been deleted, only the frame cache can show it
+                self.create_combined_image = None
+                self.image_label.setText('Labelled pair, its images are no longer cached')
             else:
-                print(f"Failed to load image: {self.current_image_path_1}")
-                image_1 = np.zeros((100, 100, 3), dtype=np.uint8)  # Placeholder for missing image
-            
-            # Load second image
-            image_2 = cv2.imread(self.current_image_path_2)
-            if image_2 is not None:
-                image_2 = cv2.cvtColor(image_2, cv2.COLOR_BGR2RGB)
-            else:
-                print(f"Failed to load image: {self.current_image_path_2}")
-                image_2 = np.zeros((100, 100, 3), dtype=np.uint8)  # Placeholder for missing image
-            
-            # Resize images to the same height
-            height = max(image_1.shape[0], image_2.shape[0])
-            image_1 = cv2.resize(image_1, (int(image_1.shape[1] * height / image_1.shape[0]), height))
-            image_2 = cv2.resize(image_2, (int(image_2.shape[1] * height / image_2.shape[0]), height))
-            
-            # Combine images side by side
-            combined_image = np.hstack((image_2, image_1))
-
-            # Resize combined image to fit within 1920x1080 while maintaining aspect ratio
-            max_height = 756
-            max_width = 1330
-            h, w, _ = combined_image.shape
-            if h > max_height or w > max_width:
-                scaling_factor = min(max_width / w, max_height / h)
-                new_size = (int(w * scaling_factor), int(h * scaling_factor))
-                combined_image = cv2.resize(combined_image, new_size)
-
-            # Combine current image with previous combined image, if it exists
-            if self.prev_combined_image is not None:
-                # Resize current combined image to match the previous combined image width
-                prev_h, prev_w, _ = self.prev_combined_image.shape
-                if prev_w != combined_image.shape[1]:
-                    combined_image = cv2.resize(combined_image, (prev_w, combined_image.shape[0]))
-                combined_image = np.vstack((combined_image, self.prev_combined_image))
-
-            self.create_combined_image = combined_image.copy()  # Ensure it's copied to avoid reference issues
-
-            height, width, channel = combined_image.shape
-            bytesPerLine = 3 * width
-            qImg = QImage(combined_image.data, width, height, bytesPerLine, QImage.Format_RGB888)
-            
-            self.image_label.setPixmap(QPixmap.fromImage(qImg))
+                # Show the current image above the most recent previous ones
+                if combined_image is None:
+                    with tracer.stage('compose_sync'):
+                        combined_image = self.compose_into_history(self.current_image_path_1, self.current_image_path_2)
+                else:
+                    with tracer.stage('history'):
+                        combined_image = self.history.push(combined_image)
+
+                # The history canvas is only rewritten on the next push, so no copy is needed
+                self.create_combined_image = combined_image
+
+                with tracer.stage('qpixmap'):
+                    height, width, channel = combined_image.shape
+                    bytesPerLine = 3 * width
+                    qImg = QImage(combined_image.data, width, height, bytesPerLine, QImage.Format_BGR888)
+
+                    self.image_label.setPixmap(QPixmap.fromImage(qImg))
         
             # Update label to show current image name
-            self.label.setText(os.path.basename(self.current_image_path_1))
+            burst_size = len(self.burst_members(pair))
+            self.label.setText(os.path.basename(self.current_image_path_1) + (f'  (+{burst_size - 1} in burst)' if burst_size > 1 else '')
+                               + (f'  [labelled {self.labels[pair]}]' if pair in self.labels else ''))
             
-            # Store the current combined image as the previous one for the next iteration
-            self.prev_combined_image = self.create_combined_image
-            lpid = self.extract_full_identifier(self.current_image_path_1)
-            self.universal_stack.append(lpid)
+            self.previous_identifier = self.extract_full_identifier(self.current_image_path_1)
             self.current_pair_index += 1
+            self.prefetch_upcoming()
             if self.magnifier:
                 self.magnifier.update_image_display()
             self.update_counts()
         else:
+            self.current_image_path_1 = self.current_image_path_2 = None
             self.label.setText("No More Images")
 
     def move_image(self, category, new_name):
         '''
         Move image pairs into normal and debug respectively
         '''
-        if self.current_image_path_1:
-            dest_dir_normal = os.path.join(self.image_files, category, "normal")
-            dest_dir_debug = os.path.join(self.image_files, category, "debug")
-            if not os.path.exists(dest_dir_normal):
-                os.makedirs(dest_dir_normal)
-            if not os.path.exists(dest_dir_debug):
-                os.makedirs(dest_dir_debug)
-            
-            normal_new_path = os.path.join(dest_dir_normal, (new_name + '.jpg') if new_name else os.path.basename(self.current_image_path_1))
-            debug_new_path = os.path.join(dest_dir_debug, (new_name + '_debug.jpg') if new_name else os.path.basename(self.current_image_path_2))
-            
-            shutil.move(self.current_image_path_1, normal_new_path)
-            if os.path.exists(self.current_image_path_2):
-                shutil.move(self.current_image_path_2, debug_new_path)
-            
-            self.completed_count += 1
-            self.load_next_image_pair()
+        self.label_current_pair(MOVE_SPLIT, category, new_name)
 
     def move_image_without_creating_folders(self, category, new_name):
         '''
         Moves correct images without creating folders
         Deletes the wrong images
         '''
-        dest_dir = os.path.join(self.image_files, category)  # Parent directory where 'normal' would be
-        if not os.path.exists(dest_dir):
-            os.makedirs(dest_dir)  # Ensure the directory exists
-
-        normal_new_path = os.path.join(dest_dir, (new_name + '.jpg') if new_name else os.path.basename(self.current_image_path_1))
-        shutil.move(self.current_image_path_1, normal_new_path)
-        if os.path.exists(self.current_image_path_2):  # Check if the debug image exists
-            os.remove(self.current_image_path_2)  # Delete the debug image  
-        self.completed_count += 1
-        self.load_next_image_pair()
+        self.label_current_pair(MOVE_NORMAL, category, new_name)
 
     def move_image_without_creating_folders_both(self, category, new_name):
         '''
         Moves image pairs into a common folder
         '''
-        dest_dir = os.path.join(self.image_files, category)  # Parent directory where 'normal' would be
-        if not os.path.exists(dest_dir):
-            os.makedirs(dest_dir)  # Ensure the directory exists
+        self.label_current_pair(MOVE_BOTH, category, new_name)
 
-        # Generate unique paths for both images
-        normal_new_path_1 = os.path.join(dest_dir, (new_name + '.jpg') if new_name else os.path.basename(self.current_image_path_1))
-        normal_new_path_2 = os.path.join(dest_dir, (new_name + '_debug.jpg') if new_name else os.path.basename(self.current_image_path_2))
+    def label_current_pair(self, layout, category, new_name):
+        '''
+        Hand the moves for the current pair to the background mover and show the next one
+        '''
+        if self.current_image_path_1:
+            pair = (self.current_image_path_1, self.current_image_path_2)
+            if pair in self.labels:
+                print(f"Already labelled as {self.labels[pair]}, undo it to label it again")
+                return
+            # End-to-end time of a label, from the button handler until the next pair is shown
+            with tracer.stage('label'):
+                self.record_label(pair, layout, category, new_name)
+                self.load_next_image_pair()
 
-        # Move both images
-        shutil.move(self.current_image_path_1, normal_new_path_1)
-        if os.path.exists(self.current_image_path_2):  # Check if the debug image exists
-            shutil.move(self.current_image_path_2, normal_new_path_2)
-        
-        self.completed_count += 1
+    def record_label(self, pair, layout, category, new_name):
+        '''
+        Label a pair, or every pair of the burst it stands for, as one undoable action
+        A new name gets a _2, _3, ... suffix for the later pairs of a burst
+        '''
+        members = self.burst_members(pair)
+        names = [new_name if index == 0 or not new_name else f'{new_name}_{index + 1}' for index in range(len(members))]
+        if self.manifest:
+            self.manifest.record_many([(member[0], member[1], layout, category, name) for member, name in zip(members, names)])
+        else:
+            moves = [move for member, name in zip(members, names)
+                     for move in plan_moves(layout, self.image_files, category, name, member[0], member[1])]
+            self.mover.submit(moves, pair=pair, category=category, members=members)
+        if self.leases:
+            self.leases.mark_done(pair)
+        self.set_metadata_status(pair, category)
+        self.labels[pair] = category
+        self.completed_count += len(members)
+
+    def move_failed(self, action):
+        '''
+        Take back a label whose files could not be moved, the pair is pending again
+        '''
+        pair = tuple(action['info']['pair'])
+        self.labels.pop(pair, None)
+        self.completed_count -= len(action['info']['members'])
+        if self.leases:
+            self.leases.reclaim(pair)
+        self.set_metadata_status(pair, PENDING)
+        if self.queue_index(pair) is None:
+            # Routed pairs leave the queue, put it up next
+            self.image_pairs.insert(self.current_pair_index, pair)
+        self.prefetch_upcoming()
+        self.update_counts()
+        self.label.setText(f"Failed to label {os.path.basename(pair[0])} as {action['info']['category']}: "
+                           f"{action['error']}, it is pending again")
+
+    def undo_last(self):
+        '''
+        Undo the most recent label from the journal or manifest and show that pair again
+        Returns the category that was undone, or None
+        '''
+        if self.manifest:
+            undone = self.manifest.undo()
+            pair, category = (undone[:2], undone[2]) if undone else (None, None)
+        else:
+            action = self.mover.undo()
+            pair, category = (tuple(action['info']['pair']), action['info']['category']) if action else (None, None)
+            if action and len(action['info'].get('members', ())) > 1:
+                self.bursts[pair[0]] = [tuple(member) for member in action['info']['members']]
+        if pair is None:
+            print("Nothing to undo")
+            return None
+        if self.leases:
+            self.leases.reclaim(pair)
+        self.set_metadata_status(pair, PENDING)
+        self.completed_count -= len(self.burst_members(pair))
+        self.labels.pop(pair, None)
+        index = self.queue_index(pair)
+        if index is None:
+            self.show_now(pair)
+        else:
+            self.show_pair_at(index)
+        return category
+
+    def jump_to(self, pair):
+        '''
+        Show a queued pair right away, e.g. a search result
+        Returns False if the pair is not in this session's queue
+        '''
+        index = self.queue_index(pair)
+        if index is None:
+            # A later capture of a burst is shown through the burst's first pair
+            pair = next((members[0] for members in self.bursts.values() if pair in members), None)
+            index = self.queue_index(pair) if pair else None
+        if index is None:
+            return False
+        if index != self.shown_index():
+            self.show_pair_at(index)
+        return True
+
+    def queue_index(self, pair, near=64):
+        '''
+        Position of a pair in the queue or None, looking around the current pair first
+        '''
+        low = max(0, self.current_pair_index - near)
+        for index in range(min(len(self.image_pairs), self.current_pair_index + near) - 1, low - 1, -1):
+            if self.image_pairs[index] == pair:
+                return index
+        try:
+            return self.image_pairs.index(pair)
+        except ValueError:
+            return None
+
+    def shown_index(self):
+        return self.current_pair_index - 1 if self.current_image_path_1 else None
+
+    def show_pair_at(self, index):
+        '''
+        Show the pair at a queue position, counting from 0, and continue from there
+        '''
+        if not 0 <= index < len(self.image_pairs):
+            return False
+        self.current_pair_index = index
+        self.load_next_image_pair()
+        return True
+
+    def show_previous_pair(self):
+        shown = self.shown_index()
+        return self.show_pair_at((self.current_pair_index if shown is None else shown) - 1)
+
+    def show_now(self, pair):
+        # Put the pair in front of the one currently shown
+        index = self.current_pair_index - 1 if self.current_image_path_1 else self.current_pair_index
+        self.image_pairs.insert(index, pair)
+        self.current_pair_index = index
         self.load_next_image_pair()
 
     def update_counts(self):
-        remaining_count = len(self.image_pairs) - self.current_pair_index
-        self.remaining_label.setText(f'Remaining: {remaining_count}')
+        # Labelled pairs stay in the queue for navigation, so count the pending ones
+        shown = self.shown_index()
+        shown_pending = shown is not None and self.image_pairs[shown] not in self.labels
+        remaining_count = len(self.image_pairs) - len(self.labels) - shown_pending
+        if self.scanning:
+            self.remaining_label.setText('Remaining: scanning...')
+        elif self.leases and self.folder_remaining is not None:
+            self.remaining_label.setText(f'Remaining: {self.folder_remaining} in folder, {remaining_count} claimed')
+        else:
+            self.remaining_label.setText(f'Remaining: {remaining_count}')
         self.completed_label.setText(f'Completed: {self.completed_count}')
         
     def extract_full_identifier(self, file_path):
-        # Define the pattern to match the full identifier, with optional _debug
-        pattern = r'(\d{4}_\d{2}_\d{2}_\d{2}_\d{2}_\d{2}_lpr[A-Z0-9]+)(_debug)?\.jpg'
-    
-        # Search for the pattern in the file path
-        match = re.search(pattern, file_path)
+        # Search for the full identifier, with optional _debug
+        match = IDENTIFIER_PATTERN.search(file_path)
     
         if match:
             # The first capturing group contains the identifier
             return match.group(1)
         else:
             return None
-    
-    
-    def pop_second_topmost(self):
-        if len(self.universal_stack) < 2:
-            print("Not enough elements in the stack to pop the second topmost element.")
-            return None
-        else:
-            top_element = self.universal_stack.pop()  # Remove and store the top element
-            second_topmost_element = self.universal_stack.pop()  # Remove and store the second topmost element
-            self.universal_stack.append(top_element)  # Put back the top element
-            return second_topmost_element
+
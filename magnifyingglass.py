@@ -1,14 +1,46 @@
 # magnifyingglass.py
-import cv2
-import numpy as np
-from PyQt5.QtGui import QImage, QPixmap
+from functools import lru_cache
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QImage, QPixmap, QGuiApplication
+from PyQt5.QtWidgets import QLabel
+from timing import tracer
+from load_image import pair_layout
+from pyramid import PyramidCache
+from lazy import lazy_import
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+@lru_cache(maxsize=8)
+def lens_mask(size):
+    '''
+    Circular alpha mask for a lens of the given size, shared between renders
+    '''
+    mask = np.zeros((size, size), dtype=np.uint8)
+    cv2.circle(mask, (size // 2, size // 2), size // 2, 255, -1)
+    mask.setflags(write=False)
+    return mask
 
 class MagnifyingGlass:
-    def __init__(self, loader, magnifying_glass_size=500, magnifying_glass_zoom=3):
+    '''
+    render_mode 'overlay' only renders the lens's bounding box and shows it in a
+    transparent label on top of the unchanged image, with mouse moves coalesced
+    to one render per display refresh. 'full' redraws the whole frame per move.
+    Over the current pair the lens samples pyramids of the original images, the
+    downscaled frame is only used until those are built or with source_cache_bytes=0
+    '''
+    def __init__(self, loader, magnifying_glass_size=500, magnifying_glass_zoom=3, render_mode='overlay',
+                 source_cache_bytes=256 * 2**20):
         self.loader = loader
         self.magnifying_glass_size = magnifying_glass_size
         self.magnifying_glass_zoom = magnifying_glass_zoom
         self.magnifying_glass_pos = None
+        self.render_mode = render_mode
+        self.overlay = None
+        self.render_timer = None
+        self.pyramids = None
+        if source_cache_bytes > 0:
+            self.pyramids = PyramidCache(source_cache_bytes)
+            self.pyramids.pyramid_ready.connect(lambda *args: self.update_image_display())
 
     def draw_magnifying_glass(self, image, pos):
         if pos is None:
@@ -29,8 +61,10 @@ class MagnifyingGlass:
             return image  # Return original image if invalid region
 
         # Extract and resize the region
-        region = image[y1:y2, x1:x2]
-        magnified_region = cv2.resize(region, (size, size), interpolation=cv2.INTER_LINEAR)
+        magnified_region = self.sample_source(pos, max(1, size // zoom))
+        if magnified_region is None:
+            region = image[y1:y2, x1:x2]
+            magnified_region = cv2.resize(region, (size, size), interpolation=cv2.INTER_LINEAR)
 
         # Calculate the placement position
         place_x1 = max(0, x - size // 2)
@@ -52,16 +86,134 @@ class MagnifyingGlass:
 
         return result
 
+    def draw_lens(self, image, pos):
+        '''
+        Render only the lens for the given position
+        Returns a BGRA patch and its top-left corner in image coordinates,
+        or None if the lens does not overlap the image
+        '''
+        if pos is None:
+            return None
+
+        x, y = pos
+        h, w, _ = image.shape
+        size = self.magnifying_glass_size
+        zoom = self.magnifying_glass_zoom
+        radius = size // 2
+
+        # Clip the lens bounding box to the image
+        left, top = x - radius, y - radius
+        x1, y1 = max(0, left), max(0, top)
+        x2, y2 = min(w, left + size), min(h, top + size)
+        if x2 <= x1 or y2 <= y1:
+            return None
+
+        # Sample the region around the cursor and scale it up to the lens size
+        region_size = max(1, size // zoom)
+        magnified_region = self.sample_source(pos, region_size)
+        if magnified_region is None:
+            region = cv2.getRectSubPix(image, (region_size, region_size), (float(x), float(y)))
+            magnified_region = cv2.resize(region, (size, size), interpolation=cv2.INTER_LINEAR)
+
+        crop = (slice(y1 - top, y2 - top), slice(x1 - left, x2 - left))
+        lens = cv2.cvtColor(magnified_region[crop], cv2.COLOR_BGR2BGRA)
+        lens[:, :, 3] = lens_mask(size)[crop]
+        return lens, (x1, y1)
+
+    def sample_source(self, pos, region_size):
+        '''
+        Render the lens from the original image under pos, a point of the displayed frame
+        region_size is the lens's footprint in frame pixels. Returns None when pos is
+        not over the current pair or its pyramids are not built yet
+        '''
+        if self.pyramids is None:
+            return None
+        strips = self.loader.history.strips
+        if strips is None:
+            return None
+        # The current pair is the top strip, the debug image on the left
+        strip_h, strip_w = strips.shape[1:3]
+        x, y = pos
+        if not 0 <= y < strip_h:
+            return None
+        debug, normal = self.pyramids.request((self.loader.current_image_path_2, self.loader.current_image_path_1))
+        if debug is None or normal is None:
+            return None
+        for pyramid, (left, top, width, height) in zip((debug, normal), pair_layout(normal.shape, debug.shape, strip_h, strip_w)):
+            if left <= x < left + width and top <= y < top + height:
+                scale = pyramid.shape[1] / width
+                center = ((x - left + 0.5) * scale - 0.5, (y - top + 0.5) * pyramid.shape[0] / height - 0.5)
+                return pyramid.sample(center, region_size * scale, self.magnifying_glass_size)
+        return None
+
+    def shutdown(self):
+        if self.pyramids:
+            self.pyramids.shutdown()
+
     def mouseMoveEvent(self, event):
         if self.loader.image_label.pixmap() is not None:
             self.magnifying_glass_pos = (event.x(), event.y())
-            self.update_image_display()
+            if self.render_mode == 'overlay':
+                self.schedule_render()
+            else:
+                self.update_image_display()
+
+    def schedule_render(self):
+        # Coalesce mouse moves so the lens is rendered at most once per display refresh
+        if self.render_timer is None:
+            screen = QGuiApplication.primaryScreen()
+            refresh_rate = screen.refreshRate() if screen else 60
+            self.render_timer = QTimer()
+            self.render_timer.setSingleShot(True)
+            self.render_timer.setInterval(max(1, int(1000 / max(refresh_rate, 1))))
+            self.render_timer.timeout.connect(self.update_image_display)
+        if not self.render_timer.isActive():
+            self.render_timer.start()
+
+    def pixmap_offset(self):
+        # The pixmap is centred inside the label, so widget and image coordinates differ
+        label = self.loader.image_label
+        pixmap = label.pixmap()
+        return (max(0, (label.width() - pixmap.width()) // 2),
+                max(0, (label.height() - pixmap.height()) // 2))
+
+    def update_overlay(self):
+        label = self.loader.image_label
+        if self.overlay is None:
+            self.overlay = QLabel(label)
+            self.overlay.setAttribute(Qt.WA_TransparentForMouseEvents)
+            self.overlay.setAttribute(Qt.WA_TranslucentBackground)
+
+        lens = None
+        if self.magnifying_glass_pos is not None and label.pixmap() is not None:
+            offset_x, offset_y = self.pixmap_offset()
+            x, y = self.magnifying_glass_pos
+            lens = self.draw_lens(self.loader.create_combined_image, (x - offset_x, y - offset_y))
+        if lens is None:
+            self.overlay.hide()
+            return
+
+        patch, (x1, y1) = lens
+        height, width, _ = patch.shape
+        # ARGB32 is stored as B, G, R, A bytes on little-endian machines
+        qImg = QImage(patch.data, width, height, 4 * width, QImage.Format_ARGB32)
+        self.overlay.setPixmap(QPixmap.fromImage(qImg))
+        self.overlay.setGeometry(x1 + offset_x, y1 + offset_y, width, height)
+        self.overlay.show()
+        self.overlay.raise_()
 
     def update_image_display(self):
-        if self.loader.current_image_path_1 and self.loader.current_image_path_2:
+        with tracer.stage('magnifier'):
+            self.render()
+
+    def render(self):
+        if self.loader.current_image_path_1 and self.loader.current_image_path_2 and self.loader.create_combined_image is not None:
+            if self.render_mode == 'overlay':
+                self.update_overlay()
+                return
             combined_image = self.loader.create_combined_image
             magnified_image = self.draw_magnifying_glass(combined_image, self.magnifying_glass_pos)
             height, width, channel = magnified_image.shape
             bytesPerLine = 3 * width
-            qImg = QImage(magnified_image.data, width, height, bytesPerLine, QImage.Format_RGB888)
+            qImg = QImage(magnified_image.data, width, height, bytesPerLine, QImage.Format_BGR888)
             self.loader.image_label.setPixmap(QPixmap.fromImage(qImg))
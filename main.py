@@ -1,9 +1,12 @@
 # main.py
 import os
 import sys
+import argparse
 from PyQt5.QtWidgets import QApplication, QWidget, QShortcut
 from PyQt5.QtGui import QKeySequence
 from load_UI import LoadUI
+from preview_cache import DEFAULT_CACHE_DIR
+from timing import tracer
 
 # Get the path to the current conda environment
 conda_env_path = sys.prefix
@@ -13,9 +16,9 @@ qt_plugin_path = os.path.join(conda_env_path, "lib", "python3.12", "site-package
 os.environ["QT_QPA_PLATFORM_PLUGIN_PATH"] = qt_plugin_path
 
 class ImageInspector(QWidget):
-    def __init__(self):
+    def __init__(self, loader_options=None, magnifier_options=None, grid_options=None, folder=None):
         super().__init__()
-        self.load_ui = LoadUI(self)
+        self.load_ui = LoadUI(self, loader_options, magnifier_options, grid_options, folder)
         self.load_ui.initUI()
         self.load_ui.assign_methods_to_parent()
 
@@ -28,8 +31,81 @@ class ImageInspector(QWidget):
     def update_counts(self):
         self.loader.update_counts()
 
+def parse_args():
+    parser = argparse.ArgumentParser(description='Image Inspector')
+    parser.add_argument('folder', nargs='?',
+                        help='Folder with the image pairs, asked for in a dialog if left out')
+    parser.add_argument('--prefetch', type=int, default=8,
+                        help='Number of upcoming image pairs to decode in the background (0 disables prefetching)')
+    parser.add_argument('--prefetch-workers', type=int, default=4,
+                        help='Number of worker threads used for prefetching')
+    parser.add_argument('--history', type=int, default=1,
+                        help='Number of previously labelled pairs shown below the current one')
+    parser.add_argument('--recursive', action='store_true',
+                        help='Also look for image pairs in subfolders')
+    parser.add_argument('--watch-interval', type=float, default=5,
+                        help='Seconds between checks for newly arrived image pairs (0 disables)')
+    parser.add_argument('--preview-cache', default=DEFAULT_CACHE_DIR,
+                        help='Folder for cached side-by-side previews shared across sessions')
+    parser.add_argument('--no-preview-cache', action='store_true',
+                        help='Always decode the original images')
+    parser.add_argument('--preview-cache-size', type=int, default=2048,
+                        help='Size budget of the preview cache in MiB')
+    parser.add_argument('--frame-cache-size', type=int, default=512,
+                        help='Memory budget in MiB for decoded pairs kept for going back, 0 to disable')
+    parser.add_argument('--label-only', action='store_true',
+                        help='Record labels in a manifest instead of moving files, apply it later with manifest.py')
+    parser.add_argument('--shared', action='store_true',
+                        help='Coordinate with other reviewers on the same folder by claiming batches of pairs')
+    parser.add_argument('--lease-batch', type=int, default=50,
+                        help='Pairs claimed at a time in shared mode')
+    parser.add_argument('--lease-ttl', type=float, default=120,
+                        help='Seconds after which the claims of an unresponsive instance expire')
+    parser.add_argument('--quality-workers', type=int, default=4,
+                        help='Worker threads scoring sharpness and exposure in the background (0 disables)')
+    parser.add_argument('--burst-window', type=float, default=0,
+                        help='Group captures of the same plate at most this many seconds apart and label them together (0 disables)')
+    parser.add_argument('--burst-hash-distance', type=int,
+                        help='Only group captures whose perceptual hashes differ in at most this many of 64 bits')
+    parser.add_argument('--grid', default='3x6',
+                        help='Columns x rows of thumbnails in the grid review')
+    parser.add_argument('--timing', action='store_true',
+                        help='Record per-stage latencies and show live percentiles (toggle with F12)')
+    parser.add_argument('--trace',
+                        help='Write every timing sample to this file, as a Chrome trace if it ends in .json, else JSONL')
+    parser.add_argument('--magnifier', choices=['overlay', 'full'], default='overlay',
+                        help="'overlay' renders only the lens on top of the image, 'full' redraws the whole frame")
+    parser.add_argument('--magnifier-cache-size', type=int, default=256,
+                        help='Memory budget in MiB for full resolution images under the magnifier, 0 to zoom the display frame')
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
+    loader_options = {
+        'prefetch_depth': args.prefetch,
+        'prefetch_workers': args.prefetch_workers,
+        'history_depth': args.history,
+        'recursive': args.recursive,
+        'watch_interval': args.watch_interval,
+        'preview_cache_dir': None if args.no_preview_cache else args.preview_cache,
+        'preview_cache_bytes': args.preview_cache_size * 2**20,
+        'frame_cache_bytes': args.frame_cache_size * 2**20,
+        'output_mode': 'manifest' if args.label_only else 'move',
+        'shared': args.shared,
+        'lease_batch': args.lease_batch,
+        'lease_ttl': args.lease_ttl,
+        'quality_workers': args.quality_workers,
+        'burst_window': args.burst_window,
+        'burst_hash_distance': args.burst_hash_distance,
+        'background_scan': True,
+    }
+    magnifier_options = {'render_mode': args.magnifier, 'source_cache_bytes': args.magnifier_cache_size * 2**20}
+    columns, rows = (int(n) for n in args.grid.lower().split('x'))
+    grid_options = {'columns': columns, 'rows': rows}
+    if args.timing or args.trace:
+        tracer.enable(args.trace)
     app = QApplication([])
-    inspector = ImageInspector()
+    inspector = ImageInspector(loader_options, magnifier_options, grid_options, args.folder)
+    app.aboutToQuit.connect(inspector.load_ui.shutdown)
     inspector.show()
     app.exec_()
@@ -0,0 +1,156 @@
+# manifest.py
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+class LabelManifest:
+    '''
+    Records label decisions in a SQLite table instead of moving files
+    Paths are stored relative to the image folder and a pair has at most one
+    row, so labelling it again replaces the earlier decision
+    '''
+    def __init__(self, path, image_files):
+        self.path = path
+        self.image_files = image_files
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        with self.db:
+            self.db.execute('''CREATE TABLE IF NOT EXISTS labels (
+                                   path_1 TEXT PRIMARY KEY, path_2 TEXT, layout TEXT, category TEXT,
+                                   new_name TEXT, timestamp REAL, applied INTEGER DEFAULT 0)''')
+            self.db.execute('CREATE INDEX IF NOT EXISTS labels_applied ON labels (applied)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS labels_category ON labels (category)')
+
+    def relative(self, path):
+        return os.path.relpath(path, self.image_files)
+
+    def absolute(self, path):
+        return os.path.join(self.image_files, path)
+
+    def record(self, path_1, path_2, layout, category, new_name):
+        self.record_many([(path_1, path_2, layout, category, new_name)])
+
+    def record_many(self, rows):
+        '''
+        Record several labels as one decision, undone together
+        '''
+        timestamp = time.time()
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO labels (path_1, path_2, layout, category, new_name, timestamp) '
+                                'VALUES (?, ?, ?, ?, ?, ?)',
+                                [(self.relative(path_1), self.relative(path_2), layout, category, new_name, timestamp)
+                                 for path_1, path_2, layout, category, new_name in rows])
+
+    def undo(self):
+        '''
+        Remove the most recent label that has not been applied yet
+        Returns its (path_1, path_2, category) or None; for a decision recorded
+        with record_many the first pair is returned and all of them are removed
+        '''
+        row = self.db.execute('SELECT timestamp FROM labels WHERE applied = 0 ORDER BY rowid DESC LIMIT 1').fetchone()
+        if row is None:
+            return None
+        first = self.db.execute('SELECT path_1, path_2, category FROM labels WHERE applied = 0 AND timestamp = ? '
+                                'ORDER BY rowid LIMIT 1', row).fetchone()
+        with self.db:
+            self.db.execute('DELETE FROM labels WHERE applied = 0 AND timestamp = ?', row)
+        return self.absolute(first[0]), self.absolute(first[1]), first[2]
+
+    def labels(self):
+        '''
+        All recorded labels as (path_1, path_2, category)
+        '''
+        return [(self.absolute(path_1), self.absolute(path_2), category)
+                for path_1, path_2, category in self.db.execute('SELECT path_1, path_2, category FROM labels')]
+
+    def labelled_paths(self):
+        return {self.absolute(path) for path, in self.db.execute('SELECT path_1 FROM labels')}
+
+    def count(self):
+        return self.db.execute('SELECT COUNT(*) FROM labels').fetchone()[0]
+
+    def pending(self):
+        '''
+        Labels that have not been applied, as (path_1, path_2, layout, category, new_name)
+        '''
+        return self.rows(applied=0)
+
+    def applied(self):
+        return self.rows(applied=1)
+
+    def rows(self, applied):
+        rows = self.db.execute('SELECT path_1, path_2, layout, category, new_name FROM labels WHERE applied = ?', (applied,))
+        return [(self.absolute(path_1), self.absolute(path_2), layout, category, new_name)
+                for path_1, path_2, layout, category, new_name in rows]
+
+    def mark_applied(self, paths):
+        with self.db:
+            self.db.executemany('UPDATE labels SET applied = 1 WHERE path_1 = ?', [(self.relative(path),) for path in paths])
+
+    def close(self):
+        self.db.close()
+
+def apply_moves(moves):
+    '''
+    Perform planned (src, dst) moves; a dst of None deletes src
+    Moves that already happened are skipped, so a pass can be repeated
+    '''
+    for src, dst in moves:
+        if dst is None:
+            if os.path.exists(src):
+                os.remove(src)
+        elif os.path.exists(src):
+            shutil.move(src, dst)
+        elif not os.path.exists(dst):
+            raise FileNotFoundError(src)
+
+def apply_manifest(manifest, workers=8, progress=None):
+    '''
+    Perform all pending moves from a manifest in one parallel pass
+    progress(applied, failed) is called as each pair finishes.
+    Returns the number of pairs applied and the number that failed
+    '''
+    from load_image import plan_moves
+    planned = [(label[0], plan_moves(label[2], manifest.image_files, label[3], label[4], label[0], label[1]))
+               for label in manifest.pending()]
+
+    # Create every destination folder once up front rather than per move
+    for dest_dir in {os.path.dirname(dst) for _, moves in planned for _, dst in moves if dst}:
+        os.makedirs(dest_dir, exist_ok=True)
+
+    applied, failed = [], 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for (path_1, moves), future in zip(planned, [executor.submit(apply_moves, moves) for _, moves in planned]):
+            try:
+                future.result()
+                applied.append(path_1)
+                if progress:
+                    progress(1, 0)
+            except OSError as e:
+                print(f"Failed to apply label for {path_1}: {e}")
+                failed += 1
+                if progress:
+                    progress(0, 1)
+    manifest.mark_applied(applied)
+    return len(applied), failed
+
+def manifest_path(image_files):
+    from load_image import STATE_DIR
+    return os.path.join(image_files, STATE_DIR, 'labels.sqlite')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Apply labels recorded in label-only mode by moving the files')
+    parser.add_argument('folder', help='Image folder that was labelled')
+    parser.add_argument('--workers', type=int, default=8, help='Number of parallel move workers')
+    args = parser.parse_args()
+
+    manifest = LabelManifest(manifest_path(args.folder), args.folder)
+    start = time.perf_counter()
+    applied, failed = apply_manifest(manifest, args.workers)
+    print(f"Applied {applied} labels in {time.perf_counter() - start:.1f}s, {failed} failed")
+    manifest.close()
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,235 @@
+# metadata_index.py
+import os
+import re
+import calendar
+import threading
+from lazy import lazy_import
+np = lazy_import('numpy')
+
+# Every capture name starts with YYYY_MM_DD_HH_MM_SS_lpr
+PREFIX_LENGTH = 23
+DIGIT_COLUMNS = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
+SEPARATOR_COLUMNS = [4, 7, 10, 13, 16, 19]
+PENDING = 'pending'
+
+def parse_names(names, chunk_size=65536):
+    '''
+    Parse capture timestamps and plates from many file names at once
+    Returns (valid mask, seconds since the epoch, plates); entries that are not
+    valid capture names have a timestamp of 0 and an empty plate
+    '''
+    valid, seconds = np.zeros(len(names), dtype=bool), np.zeros(len(names), dtype=np.int64)
+    # Chunks keep the temporary code point arrays small on million-file folders
+    for begin in range(0, len(names), chunk_size):
+        valid[begin:begin + chunk_size], seconds[begin:begin + chunk_size] = parse_prefixes(names[begin:begin + chunk_size])
+    plates = [name[PREFIX_LENGTH:name.rfind('.')] if ok else '' for name, ok in zip(names, valid.tolist())]
+    return valid, seconds, plates
+
+def parse_prefixes(names):
+    # Only the fixed-width prefix is needed, longer names are truncated by the dtype
+    codes = np.array(names, dtype=f'U{PREFIX_LENGTH}').view(np.uint32).reshape(len(names), PREFIX_LENGTH)
+    digits = codes[:, DIGIT_COLUMNS].astype(np.int64) - ord('0')
+    valid = ((digits >= 0) & (digits <= 9)).all(axis=1)
+    valid &= (codes[:, SEPARATOR_COLUMNS] == ord('_')).all(axis=1)
+    valid &= (codes[:, 20] == ord('l')) & (codes[:, 21] == ord('p')) & (codes[:, 22] == ord('r'))
+    digits[~valid] = 0
+
+    # Combine digit pairs into fields, then let datetime64 handle month lengths and leap years
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month, day, hour, minute, second = (digits[:, i] * 10 + digits[:, i + 1] for i in range(4, 14, 2))
+    valid &= (year >= 1970) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+    valid &= (hour <= 23) & (minute <= 59) & (second <= 59)
+    months = np.where(valid, (year - 1970) * 12 + month - 1, 0).astype('datetime64[M]')
+    days = months.astype('datetime64[D]') + np.where(valid, day - 1, 0)
+    # A day past the end of its month, e.g. 2024_02_30, runs into the next month
+    valid &= days.astype('datetime64[M]') == months
+    seconds = days.astype(np.int64) * 86400 + hour * 3600 + minute * 60 + second
+    seconds[~valid] = 0
+    return valid, seconds
+
+def parse_time_bound(text, end=False):
+    '''
+    Turn a possibly partial time like 2024_06_06 or 2024-06-06 14:30 into seconds
+    since the epoch; with end=True the last second of that period is returned
+    Returns None for empty text and for fields out of range, e.g. a month of 0
+    while 2024_06 is still being typed
+    '''
+    fields = [int(field) for field in re.findall(r'\d+', text)][:6]
+    if not fields:
+        return None
+    limits = [(1970, 9999), (1, 12), (1, 31), (0, 23), (0, 59), (0, 59)]
+    if any(not low <= field <= high for field, (low, high) in zip(fields, limits)):
+        return None
+    if len(fields) >= 3 and fields[2] > calendar.monthrange(fields[0], fields[1])[1]:
+        return None
+    values = fields + [1, 1, 0, 0, 0][len(fields) - 1:]
+    start = calendar.timegm(tuple(values[:6]))
+    if not end:
+        return start
+    if len(fields) == 1:
+        return calendar.timegm((fields[0] + 1, 1, 1, 0, 0, 0)) - 1
+    if len(fields) == 2:
+        year, month = fields[0] + fields[1] // 12, fields[1] % 12 + 1
+        return calendar.timegm((year, month, 1, 0, 0, 0)) - 1
+    return start + (86400, 3600, 60, 1)[len(fields) - 3] - 1
+
+class MetadataIndex:
+    '''
+    Columnar index of capture time, plate and label status for a whole folder
+    Rows are sorted by capture time, so a time range is two binary searches.
+    Plates are stored once each with an n-gram index over them, and a CSR table
+    lists the rows of every plate, so a plate substring query only touches the
+    plates that contain the query's trigrams. Queries matching many plates select
+    their rows with a mask over the time range instead.
+    '''
+    def __init__(self, entries):
+        '''
+        entries is a list of (path_1, path_2, status) with status a category or PENDING
+        '''
+        names = [entry[0].rpartition(os.sep)[2] for entry in entries]
+        valid, seconds, plates = parse_names(names)
+        keep = np.flatnonzero(valid)
+        order = keep[np.argsort(seconds[keep], kind='stable')]
+
+        self.timestamps = seconds[order]
+        # Rows point into entries rather than copying a million path tuples
+        self.entries = entries
+        self.entry_rows = order
+        self.status_names = [PENDING] + sorted({entry[2] for entry in entries} - {PENDING})
+        codes = {name: code for code, name in enumerate(self.status_names)}
+        self.status = np.array([codes[entry[2]] for entry in entries], dtype=np.int16)[order]
+        self.lock = threading.Lock()
+
+        self.plates, self.plate_ids = np.unique(np.array(plates, dtype=str)[order], return_inverse=True)
+        self.plate_ids = self.plate_ids.ravel()
+        self.plate_order = np.argsort(self.plate_ids, kind='stable')
+        self.plate_offsets = np.searchsorted(self.plate_ids[self.plate_order], np.arange(len(self.plates) + 1))
+
+        # Grams of one to three characters, so short queries are a single lookup too.
+        # Characters are numbered by rank, which packs a gram and a plate id into one
+        # integer, so the postings are a single sort of plain integers
+        width = self.plates.dtype.itemsize // 4
+        codes = self.plates.view(np.uint32).reshape(len(self.plates), width)
+        chars = np.unique(codes[codes != 0])
+        self.alphabet = {chr(char): rank + 1 for rank, char in enumerate(chars.tolist())}
+        self.gram_base = len(chars) + 1
+        ranks = np.where(codes != 0, np.searchsorted(chars, codes) + 1, 0).astype(np.int64)
+        keys, ids = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        for size in (1, 2, 3):
+            for i in range(width - size + 1):
+                key = sum(ranks[:, i + j] * self.gram_base ** j for j in range(size))
+                present = (ranks[:, i:i + size] != 0).all(axis=1)
+                keys.append(key[present])
+                ids.append(np.flatnonzero(present))
+        keys, ids = np.concatenate(keys), np.concatenate(ids)
+        count = max(len(self.plates), 1)
+        if self.gram_base ** 3 * count < 2**63:
+            packed = np.sort(keys * count + ids)
+            keys, ids = np.divmod(packed, count)
+        else:
+            # Too many distinct characters to pack, sort on both columns
+            order = np.lexsort((ids, keys))
+            keys, ids = keys[order], ids[order]
+        distinct = np.ones(len(keys), dtype=bool)
+        distinct[1:] = (keys[1:] != keys[:-1]) | (ids[1:] != ids[:-1])
+        keys, ids = keys[distinct], ids[distinct]
+        bounds = np.flatnonzero(np.diff(keys)) + 1
+        self.grams = dict(zip(keys[np.r_[0, bounds]].tolist() if len(keys) else [], np.split(ids, bounds) if len(keys) else []))
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def pair(self, row):
+        return tuple(self.entries[self.entry_rows[row]][:2])
+
+    def status_code(self, status):
+        if status not in self.status_names:
+            self.status_names.append(status)
+        return self.status_names.index(status)
+
+    def gram_key(self, gram):
+        # None for characters no plate contains
+        key = 0
+        for j, char in enumerate(gram):
+            rank = self.alphabet.get(char)
+            if rank is None:
+                return None
+            key += rank * self.gram_base ** j
+        return key
+
+    def matching_plates(self, query):
+        query = query.upper()
+        if len(query) <= 3:
+            return self.grams.get(self.gram_key(query), np.zeros(0, dtype=np.int64))
+        candidates = None
+        for i in range(len(query) - 2):
+            ids = self.grams.get(self.gram_key(query[i:i + 3]))
+            if ids is None:
+                return np.zeros(0, dtype=np.int64)
+            candidates = ids if candidates is None else np.intersect1d(candidates, ids, assume_unique=True)
+        # Shared trigrams do not guarantee the whole query is there, check the survivors
+        return candidates[np.char.find(self.plates[candidates], query) >= 0]
+
+    def search(self, plate=None, start=None, end=None, status=None):
+        '''
+        Return the matching rows in capture order
+        plate is a substring, start and end are inclusive seconds since the epoch
+        and status is a category name or PENDING
+        '''
+        low = 0 if start is None else int(np.searchsorted(self.timestamps, start, 'left'))
+        high = len(self.timestamps) if end is None else int(np.searchsorted(self.timestamps, end, 'right'))
+        if status is not None and status not in self.status_names:
+            return np.zeros(0, dtype=np.int64)
+        if plate:
+            rows = self.plate_rows(self.matching_plates(plate), low, high)
+            if status is not None:
+                rows = rows[self.status[rows] == self.status_names.index(status)]
+        elif status is not None:
+            rows = low + np.flatnonzero(self.status[low:high] == self.status_names.index(status))
+        else:
+            rows = np.arange(low, high)
+        return rows
+
+    def plate_rows(self, plate_ids, low, high):
+        '''
+        Rows in [low, high) whose plate is one of plate_ids, in capture order
+        '''
+        starts = self.plate_offsets[plate_ids]
+        counts = self.plate_offsets[plate_ids + 1] - starts
+        total = int(counts.sum())
+        if total * 8 > high - low:
+            # Too many rows to gather and sort, test every row of the time range instead
+            wanted = np.zeros(len(self.plates), dtype=bool)
+            wanted[plate_ids] = True
+            return low + np.flatnonzero(wanted[self.plate_ids[low:high]])
+        # Expand the CSR slices of all plates at once, positions within each run from its start
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+        rows = self.plate_order[positions]
+        return np.sort(rows[(rows >= low) & (rows < high)])
+
+    def row_of(self, path_1):
+        '''
+        Find a pair's row through its capture time instead of a path lookup table
+        '''
+        valid, seconds, _ = parse_names([os.path.basename(path_1)])
+        if not valid[0]:
+            return None
+        low = int(np.searchsorted(self.timestamps, seconds[0], 'left'))
+        high = int(np.searchsorted(self.timestamps, seconds[0], 'right'))
+        for row in range(low, high):
+            if self.entries[self.entry_rows[row]][0] == path_1:
+                return row
+        return None
+
+    def set_status(self, path_1, status):
+        row = self.row_of(path_1)
+        if row is not None:
+            with self.lock:
+                self.status[row] = self.status_code(status)
+
+    def describe(self, row):
+        '''
+        Return (timestamp text, plate, status, path_1) for showing a row
+        '''
+        timestamp = np.datetime64(int(self.timestamps[row]), 's').astype(str).replace('T', ' ')
+        return timestamp, str(self.plates[self.plate_ids[row]]), self.status_names[self.status[row]], self.pair(row)[0]
@@ -0,0 +1,104 @@
+# pair_index.py
+import os
+import re
+import time
+
+TIMESTAMP_PATTERN = re.compile(r'\d{4}_\d{2}_\d{2}_\d{2}_\d{2}_\d{2}')
+
+# Directory mtimes this recent are not trusted, NFS may only store whole seconds
+MTIME_GRACE_NS = 2 * 10**9
+
+def pair_sort_key(pair):
+    '''
+    Order pairs by the capture timestamp at the start of the file name
+    '''
+    directory, name = os.path.split(pair[0])
+    match = TIMESTAMP_PATTERN.match(name)
+    return (match is None, match.group(0) if match else '', name, directory)
+
+class PairIndex:
+    '''
+    Incremental index of `name.jpg` / `name_debug.jpg` pairs in a capture folder
+    build() scans everything once, refresh() only relists directories whose
+    mtime changed and returns the pairs that completed since the last scan.
+    count() is the number of pairs in the folder as of the last scan
+    '''
+    def __init__(self, root, recursive=False, exclude_dirs=()):
+        self.root = root
+        self.recursive = recursive
+        self.exclude_dirs = set(exclude_dirs)
+        self.dir_mtimes = {}
+        self.dir_pairs = {}
+        self.paired = set()
+
+    def build(self):
+        self.clear()
+        return self.refresh()
+
+    def clear(self):
+        self.dir_mtimes.clear()
+        self.dir_pairs.clear()
+        self.paired.clear()
+
+    def count(self):
+        return sum(len(stems) for stems in self.dir_pairs.values())
+
+    def refresh(self):
+        new_pairs = []
+        pending_dirs = [self.root] if not self.dir_mtimes else list(self.dir_mtimes)
+        while pending_dirs:
+            path = pending_dirs.pop()
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                self.dir_mtimes.pop(path, None)
+                self.dir_pairs.pop(path, None)
+                continue
+            if self.dir_mtimes.get(path) == mtime:
+                continue
+            try:
+                pending_dirs.extend(self.scan_dir(path, new_pairs))
+            except OSError as e:
+                # Listed again on the next refresh
+                print(f"Failed to list {path}: {e}")
+                self.dir_mtimes.setdefault(path, None)
+                continue
+            self.dir_mtimes[path] = mtime if time.time_ns() - mtime > MTIME_GRACE_NS else None
+        new_pairs.sort(key=pair_sort_key)
+        return new_pairs
+
+    def scan_dir(self, path, new_pairs):
+        '''
+        Record the jpgs in one directory, appending newly completed pairs
+        Returns subdirectories that have not been seen before
+        '''
+        subdirs = []
+        halves = {}
+        with os.scandir(path) as entries:
+            for entry in entries:
+                name = entry.name
+                if not name.endswith('.jpg'):
+                    if self.recursive and self.should_descend(path, entry):
+                        subdirs.append(entry.path)
+                    continue
+
+                if name.endswith('_debug.jpg'):
+                    stem, half = name[:-len('_debug.jpg')], 'debug'
+                else:
+                    stem, half = name[:-len('.jpg')], 'normal'
+                halves.setdefault(stem, set()).add(half)
+
+        # Pairs labelled and moved away drop out of the count, but are never reported again
+        stems = self.dir_pairs[path] = {stem for stem, found in halves.items() if len(found) == 2}
+        for stem in stems:
+            if (path, stem) not in self.paired:
+                self.paired.add((path, stem))
+                new_pairs.append((os.path.join(path, stem + '.jpg'), os.path.join(path, stem + '_debug.jpg')))
+        return subdirs
+
+    def should_descend(self, path, entry):
+        if entry.path in self.dir_mtimes or entry.name.startswith('.'):
+            return False
+        if path == self.root and entry.name in self.exclude_dirs:
+            return False
+        return entry.is_dir(follow_symlinks=False)
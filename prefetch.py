@@ -0,0 +1,82 @@
+# prefetch.py
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtCore import QObject, pyqtSignal
+
+class FramePrefetcher(QObject):
+    '''
+    Decodes and composes upcoming image pairs on a worker pool
+    Finished frames are handed back to the UI thread through frame_ready
+    '''
+    frame_ready = pyqtSignal(object, object)
+
+    def __init__(self, compose, depth=8, max_workers=4):
+        super().__init__()
+        self.compose = compose
+        self.depth = depth
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch')
+        self.pending = {}
+        self.frames = {}
+        # Emitted from worker threads, so Qt queues the call onto the UI thread
+        self.frame_ready.connect(self.store_frame)
+
+    def schedule(self, upcoming):
+        '''
+        Make the look-ahead window match the given upcoming pairs
+        Work for pairs that dropped out of the window is cancelled
+        '''
+        upcoming = list(upcoming)[:self.depth]
+        wanted = set(upcoming)
+        for pair in list(self.pending):
+            if pair not in wanted:
+                self.pending.pop(pair).cancel()
+        for pair in list(self.frames):
+            if pair not in wanted:
+                del self.frames[pair]
+
+        for pair in upcoming:
+            if pair in self.pending or pair in self.frames:
+                continue
+            future = self.executor.submit(self.compose, *pair)
+            self.pending[pair] = future
+            future.add_done_callback(lambda future, pair=pair: self.finished(pair, future))
+
+    def finished(self, pair, future):
+        if not future.cancelled():
+            self.frame_ready.emit(pair, future)
+
+    def store_frame(self, pair, future):
+        # Ignore results for work that was cancelled or rescheduled in the meantime
+        if self.pending.get(pair) is not future:
+            return
+        del self.pending[pair]
+        if future.exception() is None:
+            self.frames[pair] = future.result()
+        else:
+            print(f"Failed to prefetch {pair}: {future.exception()}")
+
+    def take(self, pair):
+        '''
+        Return the prefetched frame for a pair, or None on a cache miss
+        '''
+        frame = self.frames.pop(pair, None)
+        if frame is not None:
+            return frame
+        future = self.pending.pop(pair, None)
+        if future is None:
+            return None
+        if future.cancel():
+            return None
+        # Already running or finished, waiting is cheaper than starting over
+        if future.exception() is None:
+            return future.result()
+        return None
+
+    def clear(self):
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self.frames.clear()
+
+    def shutdown(self):
+        self.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
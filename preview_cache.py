@@ -0,0 +1,107 @@
+# preview_cache.py
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from lazy import lazy_import
+cv2 = lazy_import('cv2')
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'autolabeller', 'previews')
+
+class PreviewCache:
+    '''
+    On-disk cache of composed frames, shared between sessions and reviewers
+    Entries are keyed by path, size and mtime of both images of a pair and stored
+    as JPEG files next to a SQLite index of their size and last use. The least
+    recently used entries are evicted once the size budget is exceeded.
+    '''
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=2 * 2**30, quality=90, version=''):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.quality = quality
+        # Changes to how frames are composed must change the keys
+        self.version = version
+        self.local = threading.local()
+        os.makedirs(cache_dir, exist_ok=True)
+        db = self.connect()
+        with db:
+            db.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, size INTEGER, last_used REAL)')
+            db.execute('CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)')
+
+    def connect(self):
+        # SQLite connections cannot be shared between threads, so keep one per thread
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(os.path.join(self.cache_dir, 'index.sqlite'), timeout=30)
+            db.execute('PRAGMA journal_mode=WAL')
+            self.local.db = db
+        return db
+
+    def key(self, path_1, path_2):
+        '''
+        Content key for a pair, or None if either file is missing
+        '''
+        digest = hashlib.sha1(self.version.encode())
+        for path in (path_1, path_2):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return None
+            digest.update(f'\0{os.path.abspath(path)}\0{stat.st_size}\0{stat.st_mtime_ns}'.encode())
+        return digest.hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.jpg')
+
+    def get(self, key):
+        db = self.connect()
+        with db:
+            updated = db.execute('UPDATE entries SET last_used = ? WHERE key = ?', (time.time(), key)).rowcount
+        if not updated:
+            return None
+        frame = cv2.imread(self.entry_path(key))
+        if frame is None:
+            # Evicted by another process between the lookup and the read
+            with db:
+                db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            return None
+        return frame
+
+    def put(self, key, frame):
+        ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return
+        path = self.entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write under a unique name and rename so readers never see a partial file
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        encoded.tofile(temp_path)
+        os.replace(temp_path, path)
+
+        db = self.connect()
+        with db:
+            db.execute('INSERT OR REPLACE INTO entries (key, size, last_used) VALUES (?, ?, ?)',
+                       (key, encoded.size, time.time()))
+        self.evict()
+
+    def evict(self):
+        db = self.connect()
+        total = db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Trim to 90% of the budget so we do not evict again on the next put
+        excess = total - int(self.max_bytes * 0.9)
+        victims = []
+        for key, size in db.execute('SELECT key, size FROM entries ORDER BY last_used'):
+            if excess <= 0:
+                break
+            victims.append(key)
+            excess -= size
+        with db:
+            db.executemany('DELETE FROM entries WHERE key = ?', [(key,) for key in victims])
+        for key in victims:
+            try:
+                os.remove(self.entry_path(key))
+            except FileNotFoundError:
+                pass
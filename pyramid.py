@@ -0,0 +1,97 @@
+# pyramid.py
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtCore import QObject, pyqtSignal
+from frame_cache import FrameCache
+from lazy import lazy_import
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+class ImagePyramid:
+    '''
+    A full resolution image and its successive halvings, down to about min_width pixels wide
+    '''
+    def __init__(self, image, min_width=256):
+        self.levels = [image]
+        while self.levels[-1].shape[1] // 2 >= min_width:
+            self.levels.append(cv2.pyrDown(self.levels[-1]))
+        self.shape = image.shape
+        self.nbytes = sum(level.nbytes for level in self.levels)
+
+    def sample(self, center, size, out_size):
+        '''
+        Scale the size x size region around center, in full resolution pixels, to out_size x out_size
+        It is read from the pyramid level nearest to that scale, so the work per call
+        depends on out_size and not on the source resolution
+        '''
+        # The level whose region is closest to out_size, so it is scaled by at most sqrt(2) either way
+        level = 0
+        while level + 1 < len(self.levels) and size / 2 ** (level + 1) >= out_size / 2 ** 0.5:
+            level += 1
+        scale = 2 ** level
+        region_size = max(1, round(size / scale))
+        x, y = center
+        region = cv2.getRectSubPix(self.levels[level], (region_size, region_size),
+                                   ((x + 0.5) / scale - 0.5, (y + 0.5) / scale - 0.5))
+        return cv2.resize(region, (out_size, out_size), interpolation=cv2.INTER_LINEAR)
+
+def build_pyramid(path):
+    try:
+        data = np.fromfile(path, dtype=np.uint8)
+    except OSError:
+        return None
+    image = cv2.imdecode(data, cv2.IMREAD_COLOR) if data.size else None
+    return ImagePyramid(image) if image is not None else None
+
+class PyramidCache(QObject):
+    '''
+    Builds pyramids of original images on a worker thread and keeps the most recent
+    ones within a byte budget. pyramid_ready(path, future) is emitted on the UI thread
+    once a requested pyramid has been stored
+    '''
+    pyramid_ready = pyqtSignal(object, object)
+
+    def __init__(self, max_bytes=256 * 2**20, workers=1):
+        super().__init__()
+        self.pyramids = FrameCache(max_bytes)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pyramid')
+        self.pending = {}
+        self.failed = set()
+        # Connected first, so the pyramid is stored before other slots see the signal
+        self.pyramid_ready.connect(self.store)
+
+    def request(self, paths):
+        '''
+        Return the pyramid of each path, or None for those that are still being built
+        Builds for paths that are no longer wanted are cancelled
+        '''
+        for path in list(self.pending):
+            if path not in paths and self.pending[path].cancel():
+                del self.pending[path]
+        # A failed path may be readable again later, e.g. after an undo
+        self.failed &= set(paths)
+        pyramids = []
+        for path in paths:
+            pyramid = self.pyramids.get(path)
+            if pyramid is None and path not in self.pending and path not in self.failed:
+                future = self.executor.submit(build_pyramid, path)
+                self.pending[path] = future
+                future.add_done_callback(lambda future, path=path: self.finished(path, future))
+            pyramids.append(pyramid)
+        return pyramids
+
+    def finished(self, path, future):
+        if not future.cancelled():
+            self.pyramid_ready.emit(path, future)
+
+    def store(self, path, future):
+        if self.pending.get(path) is not future:
+            return
+        del self.pending[path]
+        pyramid = future.result() if future.exception() is None else None
+        if pyramid is None:
+            self.failed.add(path)
+        else:
+            self.pyramids.put(path, pyramid)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,146 @@
+# quality.py
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtCore import QObject, pyqtSignal
+from lazy import lazy_import
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+FEATURES = ('sharpness', 'brightness', 'clipped', 'overlay')
+
+# Pixels the debug image changes by more than this count as overlay, below is JPEG noise
+OVERLAY_DELTA = 40
+
+def read_gray(path, reduction=2):
+    flags = {1: cv2.IMREAD_GRAYSCALE, 2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+             4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8}[reduction]
+    try:
+        data = np.fromfile(path, dtype=np.uint8)
+    except OSError:
+        return None
+    return cv2.imdecode(data, flags) if data.size else None
+
+def quality_features(path_1, path_2, reduction=2):
+    '''
+    Quality features of a pair, computed on a reduced grayscale decode
+    sharpness is the variance of the Laplacian of the normal image, brightness its mean
+    and clipped the fraction of pixels at either end of the range. overlay is the
+    fraction of pixels the debug image changes, close to 0 when the overlay is missing.
+    Returns None if the normal image cannot be read
+    '''
+    gray = read_gray(path_1, reduction)
+    if gray is None:
+        return None
+    sharpness = float(cv2.Laplacian(gray, cv2.CV_32F).var())
+    brightness = float(gray.mean())
+    histogram = np.bincount(gray.ravel(), minlength=256)
+    clipped = float((histogram[:5].sum() + histogram[-5:].sum()) / gray.size)
+
+    overlay = 0.0
+    debug = read_gray(path_2, reduction)
+    if debug is not None:
+        if debug.shape != gray.shape:
+            debug = cv2.resize(debug, (gray.shape[1], gray.shape[0]), interpolation=cv2.INTER_AREA)
+        overlay = float(np.count_nonzero(cv2.absdiff(gray, debug) > OVERLAY_DELTA) / gray.size)
+    return (sharpness, brightness, clipped, overlay)
+
+def score_chunk(pairs):
+    return [(pair, quality_features(*pair)) for pair in pairs]
+
+class QualityScorer(QObject):
+    '''
+    Scores image pairs on a worker pool and keeps the results in a sqlite file
+    Scores are keyed by the normal image's path relative to the folder and its mtime,
+    so a restarted session only scores pairs it has not seen before.
+    progress(done, total) is emitted on the UI thread while a scoring run goes on
+    '''
+    progress = pyqtSignal(int, int)
+
+    def __init__(self, db_path, root, workers=4, chunk_size=32):
+        super().__init__()
+        self.db_path = db_path
+        self.root = root
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.scores = {}
+        self.stopped = threading.Event()
+        self.threads = []
+        self.stored = None
+        self.stored_lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+    def load_stored(self):
+        # Read on the first scoring run rather than at startup, the table can be large
+        with self.stored_lock:
+            if self.stored is None:
+                db = self.connect()
+                self.stored = {path: (mtime_ns, tuple(features)) for path, mtime_ns, *features in
+                               db.execute(f"SELECT path_1, mtime_ns, {', '.join(FEATURES)} FROM scores")}
+                db.close()
+        return self.stored
+
+    def connect(self):
+        db = sqlite3.connect(self.db_path)
+        db.execute(f"CREATE TABLE IF NOT EXISTS scores (path_1 TEXT PRIMARY KEY, mtime_ns INTEGER, "
+                   f"{', '.join(name + ' REAL' for name in FEATURES)})")
+        return db
+
+    def get(self, pair, feature='sharpness'):
+        '''
+        Return one feature of a scored pair, or None if it has not been scored
+        '''
+        features = self.scores.get(pair[0])
+        return features[FEATURES.index(feature)] if features else None
+
+    def score(self, pairs):
+        '''
+        Score pairs in the background, reusing stored scores that are still valid
+        '''
+        thread = threading.Thread(target=self.run, args=(list(pairs),), name='quality', daemon=True)
+        # Every poll with new pairs starts a run, only the ones still going need joining on close
+        self.threads = [thread for thread in self.threads if thread.is_alive()] + [thread]
+        thread.start()
+
+    def run(self, pairs):
+        stored_scores = self.load_stored()
+        todo = []
+        for pair in pairs:
+            try:
+                mtime_ns = os.stat(pair[0]).st_mtime_ns
+            except OSError:
+                continue
+            stored = stored_scores.get(os.path.relpath(pair[0], self.root))
+            if stored and stored[0] == mtime_ns:
+                self.scores[pair[0]] = stored[1]
+            else:
+                todo.append((pair, mtime_ns))
+        if not todo:
+            return
+
+        db = self.connect()
+        mtimes = dict(todo)
+        chunks = [[pair for pair, _ in todo[i:i + self.chunk_size]] for i in range(0, len(todo), self.chunk_size)]
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='quality') as executor:
+            for results in executor.map(score_chunk, chunks):
+                rows = []
+                for pair, features in results:
+                    if features is None:
+                        continue
+                    self.scores[pair[0]] = features
+                    rows.append((os.path.relpath(pair[0], self.root), mtimes[pair]) + features)
+                with db:
+                    db.executemany(f"INSERT OR REPLACE INTO scores VALUES (?, ?, {', '.join('?' * len(FEATURES))})", rows)
+                done += len(results)
+                self.progress.emit(done, len(todo))
+                if self.stopped.is_set():
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    break
+        db.close()
+
+    def close(self):
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
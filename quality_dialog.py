@@ -0,0 +1,94 @@
+# quality_dialog.py
+from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QComboBox, QDoubleSpinBox, QMessageBox
+from quality import FEATURES
+
+class QualityDialog(QDialog):
+    '''
+    Sort, filter and bulk-route the queue by the background quality scores
+    '''
+    def __init__(self, loader, parent=None):
+        super().__init__(parent)
+        self.loader = loader
+        self.initUI()
+        loader.quality.progress.connect(self.show_progress)
+
+    def initUI(self):
+        self.setWindowTitle('Image Quality')
+
+        layout = QVBoxLayout()
+
+        self.progress_label = QLabel(f'Scored: {len(self.loader.quality.scores)}', self)
+        layout.addWidget(self.progress_label)
+
+        self.current_label = QLabel(self.current_scores(), self)
+        layout.addWidget(self.current_label)
+
+        row = QHBoxLayout()
+        self.feature_box = QComboBox(self)
+        self.feature_box.addItems(FEATURES)
+        row.addWidget(self.feature_box)
+        self.threshold_box = QDoubleSpinBox(self)
+        self.threshold_box.setRange(0, 1e6)
+        self.threshold_box.setDecimals(3)
+        self.threshold_box.setValue(100)
+        row.addWidget(self.threshold_box)
+        layout.addLayout(row)
+
+        row = QHBoxLayout()
+        for text, handler in [('Lowest First', lambda: self.loader.sort_queue(self.feature(), False)),
+                              ('Highest First', lambda: self.loader.sort_queue(self.feature(), True)),
+                              ('Capture Order', lambda: self.loader.sort_queue())]:
+            button = QPushButton(text, self)
+            button.clicked.connect(handler)
+            row.addWidget(button)
+        layout.addLayout(row)
+
+        row = QHBoxLayout()
+        for text, handler in [('Only Below Threshold', lambda: self.loader.filter_queue(self.feature(), high=self.threshold())),
+                              ('Only Above Threshold', lambda: self.loader.filter_queue(self.feature(), low=self.threshold())),
+                              ('Show All', self.loader.clear_filter)]:
+            button = QPushButton(text, self)
+            button.clicked.connect(handler)
+            row.addWidget(button)
+        layout.addLayout(row)
+
+        self.route_button = QPushButton('Route Below Threshold to imageblur', self)
+        self.route_button.clicked.connect(self.route_blurry)
+        layout.addWidget(self.route_button)
+
+        self.close_button = QPushButton('Close', self)
+        self.close_button.clicked.connect(self.accept)
+        layout.addWidget(self.close_button)
+
+        self.setLayout(layout)
+
+    def feature(self):
+        return self.feature_box.currentText()
+
+    def threshold(self):
+        return self.threshold_box.value()
+
+    def current_scores(self):
+        pair = (self.loader.current_image_path_1, self.loader.current_image_path_2)
+        values = [self.loader.quality.get(pair, name) for name in FEATURES] if pair[0] else [None]
+        if values[0] is None:
+            return 'Current pair: not scored'
+        return 'Current pair: ' + ', '.join(f'{name} {value:.3g}' for name, value in zip(FEATURES, values))
+
+    def done(self, result):
+        self.loader.quality.progress.disconnect(self.show_progress)
+        super().done(result)
+
+    def show_progress(self, done, total):
+        self.progress_label.setText(f'Scored: {len(self.loader.quality.scores)} ({done}/{total} in this run)')
+        self.current_label.setText(self.current_scores())
+
+    def route_blurry(self):
+        feature, threshold = self.feature(), self.threshold()
+        count = len(self.loader.pairs_below(threshold, feature))
+        if not count:
+            QMessageBox.information(self, 'Image Quality', f'No upcoming pairs have {feature} below {threshold:g}')
+            return
+        answer = QMessageBox.question(self, 'Image Quality', f'Move {count} pairs with {feature} below {threshold:g} to imageblur?')
+        if answer == QMessageBox.Yes:
+            self.loader.route_below_threshold(threshold, 'imageblur', feature)
@@ -0,0 +1,115 @@
+# search_dialog.py
+import os
+import time
+from PyQt5.QtWidgets import QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QComboBox, QListWidget, QListWidgetItem, QPushButton
+from PyQt5.QtCore import Qt, QUrl, QTimer
+from PyQt5.QtGui import QDesktopServices
+from load_image import OUTPUT_DIRS
+from metadata_index import PENDING, parse_time_bound
+
+MAX_RESULTS = 500
+SEARCH_DELAY_MS = 150
+
+class SearchDialog(QDialog):
+    '''
+    Search the folder's captures by plate, time range and label status
+    Double-clicking a pending result shows that pair in the main window
+    '''
+    def __init__(self, loader, parent=None):
+        super().__init__(parent)
+        self.loader = loader
+        self.initUI()
+        loader.build_metadata_index()
+        # The index may still be building, search again once it is ready
+        self.wait_timer = QTimer(self)
+        self.wait_timer.timeout.connect(self.wait_for_index)
+        self.wait_timer.start(100)
+        self.wait_for_index()
+
+    def initUI(self):
+        self.setWindowTitle('Search Captures')
+        self.resize(800, 600)
+
+        layout = QVBoxLayout()
+
+        row = QHBoxLayout()
+        self.plate_edit = QLineEdit(self)
+        self.plate_edit.setPlaceholderText('Plate contains')
+        row.addWidget(self.plate_edit)
+        self.start_edit = QLineEdit(self)
+        self.start_edit.setPlaceholderText('From, e.g. 2024_06_06_08')
+        row.addWidget(self.start_edit)
+        self.end_edit = QLineEdit(self)
+        self.end_edit.setPlaceholderText('To, e.g. 2024_06_06_17')
+        row.addWidget(self.end_edit)
+        self.status_box = QComboBox(self)
+        self.status_box.addItems(['any', PENDING, 'correct/single', 'correct/double', 'wrong/single', 'wrong/double']
+                                 + [category for category in OUTPUT_DIRS if category not in ('correct', 'wrong')])
+        row.addWidget(self.status_box)
+        layout.addLayout(row)
+
+        self.count_label = QLabel('', self)
+        layout.addWidget(self.count_label)
+
+        self.results = QListWidget(self)
+        self.results.itemDoubleClicked.connect(self.open_result)
+        layout.addWidget(self.results)
+
+        row = QHBoxLayout()
+        self.folder_button = QPushButton('Open Folder', self)
+        self.folder_button.clicked.connect(lambda: QDesktopServices.openUrl(QUrl.fromLocalFile(self.loader.image_files)))
+        row.addWidget(self.folder_button)
+        self.close_button = QPushButton('Close', self)
+        self.close_button.clicked.connect(self.accept)
+        row.addWidget(self.close_button)
+        layout.addLayout(row)
+
+        # Search once typing pauses rather than on every keystroke
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.search)
+        for edit in (self.plate_edit, self.start_edit, self.end_edit):
+            edit.textChanged.connect(self.search_timer.start)
+        self.status_box.currentIndexChanged.connect(self.search)
+
+        self.setLayout(layout)
+
+    def wait_for_index(self):
+        if self.loader.metadata is None:
+            self.count_label.setText('Indexing...')
+            return
+        self.wait_timer.stop()
+        self.search()
+
+    def search(self):
+        index = self.loader.metadata
+        if index is None:
+            return
+        status = self.status_box.currentText()
+        started = time.perf_counter()
+        rows = index.search(self.plate_edit.text().strip() or None,
+                            parse_time_bound(self.start_edit.text()),
+                            parse_time_bound(self.end_edit.text(), end=True),
+                            None if status == 'any' else status)
+        elapsed = (time.perf_counter() - started) * 1000
+
+        self.results.clear()
+        for row in rows[:MAX_RESULTS].tolist():
+            timestamp, plate, status, path_1 = index.describe(row)
+            item = QListWidgetItem(f'{timestamp}   {plate:12s} {status:16s} {os.path.basename(path_1)}')
+            item.setData(Qt.UserRole, row)
+            self.results.addItem(item)
+        shown = f', showing the first {MAX_RESULTS}' if len(rows) > MAX_RESULTS else ''
+        self.count_label.setText(f'{len(rows)} of {len(index)} captures in {elapsed:.2f} ms{shown}')
+
+    def open_result(self, item):
+        row = item.data(Qt.UserRole)
+        index = self.loader.metadata
+        if index.describe(row)[2] != PENDING:
+            self.count_label.setText('Only pending pairs can be opened')
+            return
+        if not self.loader.jump_to(index.pair(row)):
+            self.count_label.setText('That pair is not in this session\'s queue')
+            return
+        self.accept()
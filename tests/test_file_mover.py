@@ -0,0 +1,121 @@
+# test_file_mover.py
+import os
+import json
+from file_mover import FileMover
+
+def make_pair(folder, stem):
+    paths = (os.path.join(folder, stem + '.jpg'), os.path.join(folder, stem + '_debug.jpg'))
+    for path in paths:
+        with open(path, 'w') as f:
+            f.write(stem)
+    return paths
+
+def make_mover(tmp_path, **kwargs):
+    state = tmp_path / 'state'
+    return FileMover(str(state / 'journal.jsonl'), str(state / 'trash'), **kwargs)
+
+def read_journal(tmp_path):
+    with open(tmp_path / 'state' / 'journal.jsonl') as f:
+        return [json.loads(line) for line in f]
+
+def test_moves_and_undo_from_trash(tmp_path):
+    normal, debug = make_pair(str(tmp_path), 'a')
+    mover = make_mover(tmp_path)
+    dst = str(tmp_path / 'good' / 'a.jpg')
+    mover.submit([(normal, dst), (debug, None)], pair=[normal, debug])
+    mover.queue.join()
+    assert os.path.exists(dst) and not os.path.exists(normal) and not os.path.exists(debug)
+
+    action = mover.undo()
+    assert action['info']['pair'] == [normal, debug]
+    assert os.path.exists(normal) and os.path.exists(debug) and not os.path.exists(dst)
+    assert mover.undo() is None
+    mover.close()
+
+def test_recover_finishes_interrupted_action(tmp_path):
+    normal, debug = make_pair(str(tmp_path), 'a')
+    dst = str(tmp_path / 'good' / 'a.jpg')
+    os.makedirs(tmp_path / 'state')
+    # A session that died after journaling the action and moving only the first file
+    with open(tmp_path / 'state' / 'journal.jsonl', 'w') as f:
+        f.write(json.dumps({'op': 'begin', 'id': 7, 'moves': [[normal, dst], [debug, str(tmp_path / 'good' / 'a_debug.jpg')]],
+                            'info': {}, 'owner': None}) + '\n')
+        f.write('{"op": "do')  # Torn write
+    os.makedirs(tmp_path / 'good')
+    os.rename(normal, dst)
+
+    mover = make_mover(tmp_path)
+    assert sorted(os.listdir(tmp_path / 'good')) == ['a.jpg', 'a_debug.jpg']
+    assert [action['id'] for action in mover.undo_stack] == [7]
+    assert mover.next_id == 8
+    assert [record['op'] for record in read_journal(tmp_path)] == ['begin', 'done']
+    mover.undo()
+    assert os.path.exists(normal) and os.path.exists(debug)
+    mover.close()
+
+def test_recover_rebuilds_undo_history_across_restarts(tmp_path):
+    pairs = [make_pair(str(tmp_path), stem) for stem in 'abc']
+    mover = make_mover(tmp_path, max_undo=2)
+    for normal, debug in pairs:
+        mover.submit([(normal, str(tmp_path / 'good' / os.path.basename(normal))), (debug, None)])
+    mover.close()
+    # Only the last max_undo actions can be undone, the trash of older ones is purged
+    assert len(os.listdir(tmp_path / 'state' / 'trash')) == 2
+
+    mover = make_mover(tmp_path, max_undo=2)
+    assert [action['id'] for action in mover.undo_stack] == [2, 3]
+    mover.undo()
+    assert os.path.exists(pairs[2][0]) and os.path.exists(pairs[2][1])
+    mover.close()
+
+def test_partial_failure_is_rolled_back(tmp_path):
+    normal, debug = make_pair(str(tmp_path), 'a')
+    # A plain file where the category folder should be
+    (tmp_path / 'imageblur').write_text('')
+    failures = []
+    mover = make_mover(tmp_path, on_failed=failures.append)
+    mover.submit([(normal, str(tmp_path / 'imageblur' / 'a.jpg')), (debug, None)], pair=[normal, debug])
+    mover.queue.join()
+
+    assert os.path.exists(normal) and os.path.exists(debug)
+    trash = tmp_path / 'state' / 'trash'
+    assert not trash.exists() or not os.listdir(trash)
+    assert mover.undo_stack == []
+    assert mover.failed == failures and len(failures) == 1 and failures[0]['error']
+    assert [record['op'] for record in read_journal(tmp_path)] == ['begin', 'failed']
+    mover.close()
+
+    # A failed action is not replayed or offered for undo after a restart
+    mover = make_mover(tmp_path)
+    assert mover.undo_stack == []
+    assert os.path.exists(normal) and os.path.exists(debug)
+    mover.close()
+
+def test_failure_of_a_later_move_reverses_earlier_ones(tmp_path):
+    normal, debug = make_pair(str(tmp_path), 'a')
+    (tmp_path / 'blocked').write_text('')
+    mover = make_mover(tmp_path)
+    mover.submit([(normal, str(tmp_path / 'good' / 'a.jpg')), (debug, str(tmp_path / 'blocked' / 'a_debug.jpg'))])
+    mover.queue.join()
+    assert os.path.exists(normal) and os.path.exists(debug)
+    assert not os.path.exists(tmp_path / 'good' / 'a.jpg')
+    assert len(mover.failed) == 1
+    mover.close()
+
+def test_recover_leaves_other_owners_alone(tmp_path):
+    normal, debug = make_pair(str(tmp_path), 'a')
+    mine = make_mover(tmp_path, owner='host-1')
+    mine.submit([(normal, str(tmp_path / 'good' / 'a.jpg'))])
+    mine.close()
+
+    other = make_mover(tmp_path, owner='host-2')
+    assert other.undo_stack == [] and other.undo() is None
+    other.close()
+    assert os.path.exists(tmp_path / 'good' / 'a.jpg')
+
+    # Compaction by another owner kept the action
+    mine = make_mover(tmp_path, owner='host-1')
+    assert len(mine.undo_stack) == 1
+    mine.undo()
+    assert os.path.exists(normal)
+    mine.close()
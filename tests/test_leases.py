@@ -0,0 +1,64 @@
+# test_leases.py
+import os
+import json
+import time
+import socket
+from leases import LeaseManager
+
+def make_pairs(folder, count):
+    pairs = []
+    for i in range(count):
+        pair = (os.path.join(folder, f'p{i}.jpg'), os.path.join(folder, f'p{i}_debug.jpg'))
+        for path in pair:
+            open(path, 'w').close()
+        pairs.append(pair)
+    return pairs
+
+def make_lease(lease_dir, owner, pairs, age=0, pid=None):
+    path = os.path.join(lease_dir, owner + '.lease')
+    with open(path, 'w') as f:
+        json.dump({'owner': owner, 'pid': pid or os.getpid(), 'pairs': [pair[0] for pair in pairs], 'done': []}, f)
+    then = time.time() - age
+    os.utime(path, (then, then))
+
+def test_claim_skips_pairs_of_live_leases(tmp_path):
+    pairs = make_pairs(str(tmp_path), 6)
+    lease_dir = str(tmp_path / 'leases')
+    leases = LeaseManager(lease_dir, batch_size=3, ttl=120)
+    leases.set_owner('me')
+    make_lease(lease_dir, 'other', pairs[:2])
+    assert leases.claim(pairs) == pairs[2:5]
+    assert leases.claim(pairs) == pairs[5:]
+    assert not os.path.exists(leases.lock_path)
+
+def test_claim_takes_pairs_of_expired_leases(tmp_path):
+    pairs = make_pairs(str(tmp_path), 4)
+    lease_dir = str(tmp_path / 'leases')
+    leases = LeaseManager(lease_dir, batch_size=10, ttl=120)
+    leases.set_owner('me')
+    make_lease(lease_dir, 'dead', pairs[:2], age=600)
+    make_lease(lease_dir, 'alive', pairs[2:3])
+    assert leases.claim(pairs) == [pairs[0], pairs[1], pairs[3]]
+
+def test_claim_skips_missing_files_and_keeps_own_claims(tmp_path):
+    pairs = make_pairs(str(tmp_path), 3)
+    os.remove(pairs[1][0])
+    leases = LeaseManager(str(tmp_path / 'leases'), batch_size=10)
+    leases.set_owner('me')
+    assert leases.claim(pairs) == [pairs[0], pairs[2]]
+    assert leases.claim(pairs) == []
+    with open(leases.lease_path) as f:
+        assert json.load(f)['pairs'] == [pairs[0][0], pairs[2][0]]
+
+def test_restart_after_crash_takes_over_the_slot(tmp_path):
+    lease_dir = str(tmp_path / 'leases')
+    os.makedirs(lease_dir)
+    host = socket.gethostname()
+    # Slot 1 is held by a live process, slot 2 was left fresh by one that crashed
+    make_lease(lease_dir, f'{host}-1', [])
+    make_lease(lease_dir, f'{host}-2', [], pid=2**22 + 12345)
+    leases = LeaseManager(lease_dir)
+    leases.take_slot()
+    assert leases.owner == f'{host}-2'
+    leases.release()
+    assert not os.path.exists(leases.lease_path)
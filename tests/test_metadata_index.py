@@ -0,0 +1,50 @@
+# test_metadata_index.py
+import calendar
+from metadata_index import PENDING, MetadataIndex, parse_names, parse_time_bound
+
+def capture(stamp, plate, status=PENDING):
+    return (f'/captures/{stamp}_lpr{plate}.jpg', f'/captures/{stamp}_lpr{plate}_debug.jpg', status)
+
+def test_parse_names_rejects_impossible_times():
+    valid, seconds, plates = parse_names(['2024_02_29_23_59_59_lprAB1.jpg', '2024_02_30_00_00_00_lprAB1.jpg',
+                                          '2023_02_29_00_00_00_lprAB1.jpg', '2024_06_06_24_00_00_lprAB1.jpg',
+                                          'IMG_0001.jpg'])
+    assert valid.tolist() == [True, False, False, False, False]
+    assert seconds[0] == calendar.timegm((2024, 2, 29, 23, 59, 59))
+    assert plates == ['AB1', '', '', '', '']
+
+def test_parse_time_bound_partial_and_invalid():
+    assert parse_time_bound('2024_06') == calendar.timegm((2024, 6, 1, 0, 0, 0))
+    assert parse_time_bound('2024_06', end=True) == calendar.timegm((2024, 7, 1, 0, 0, 0)) - 1
+    assert parse_time_bound('2024-12', end=True) == calendar.timegm((2025, 1, 1, 0, 0, 0)) - 1
+    assert parse_time_bound('2024-06-06 14', end=True) == calendar.timegm((2024, 6, 6, 14, 59, 59))
+    assert parse_time_bound('') is None
+    assert parse_time_bound('2024_0') is None
+    assert parse_time_bound('2024_02_30') is None
+
+def test_search_by_plate_time_and_status():
+    entries = [capture('2024_06_06_10_00_02', 'XYZ789', 'good'), capture('2024_06_06_10_00_00', 'ABC123'),
+               capture('2024_06_06_10_00_01', 'ZABC99'), capture('2024_06_06_11_00_00', 'ABC123'),
+               capture('bad_name', 'ABC123')]
+    index = MetadataIndex(entries)
+    assert len(index) == 4
+    plates = lambda rows: [index.describe(row)[1] for row in rows]
+    assert plates(index.search('abc')) == ['ABC123', 'ZABC99', 'ABC123']
+    assert plates(index.search('C12')) == ['ABC123', 'ABC123']
+    assert plates(index.search('ABC1')) == ['ABC123', 'ABC123']
+    assert plates(index.search('ABC', end=parse_time_bound('2024_06_06_10', end=True))) == ['ABC123', 'ZABC99']
+    assert plates(index.search(status='good')) == ['XYZ789']
+    assert plates(index.search('Q')) == [] and plates(index.search('ABD')) == []
+    assert plates(index.search(status='unknown')) == []
+
+    index.set_status(entries[1][0], 'wrong')
+    assert index.describe(index.search(status='wrong')[0])[3] == entries[1][0]
+
+def test_selective_and_broad_queries_agree_with_a_scan():
+    entries = [capture(f'2024_06_06_10_{i // 60:02d}_{i % 60:02d}', f'P{i % 17:02d}X{i % 5}') for i in range(200)]
+    index = MetadataIndex(entries)
+    names = [index.describe(row)[1] for row in range(len(index))]
+    start = parse_time_bound('2024_06_06_10_00_30')
+    for query in ('P03X', 'X1', 'P1', '3X3', 'P'):
+        expected = [row for row, plate in enumerate(names) if query in plate and index.timestamps[row] >= start]
+        assert index.search(query, start=start).tolist() == expected
@@ -0,0 +1,101 @@
+# thumbnails.py
+import os
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5.QtCore import QObject, pyqtSignal
+from load_image import REDUCED_DECODE_FLAGS, read_image_data, read_jpeg_size, decode_image, compose_into
+from preview_cache import PreviewCache
+from frame_cache import FrameCache
+from lazy import lazy_import
+np = lazy_import('numpy')
+
+def thumbnail_reduction(size, tile_height):
+    # Largest decode reduction that still leaves at least the tile's height
+    if size is None or 0 in size:
+        return 1
+    return max(r for r in REDUCED_DECODE_FLAGS if size[0] / r >= tile_height or r == 1)
+
+def make_thumbnail(path_1, path_2, tile_width, tile_height):
+    '''
+    Compose a pair into a tile_width x tile_height BGR tile, debug image on the left
+    Both JPEGs are decoded at the largest reduction that still fills the tile
+    '''
+    images = []
+    for slot, path in enumerate((path_1, path_2)):
+        data = read_image_data(path, slot)
+        image = decode_image(data, thumbnail_reduction(read_jpeg_size(data), tile_height) if data is not None else 1)
+        images.append(image if image is not None else np.zeros((tile_height, tile_width // 2, 3), dtype=np.uint8))
+    return compose_into(images[0], images[1], np.empty((tile_height, tile_width, 3), dtype=np.uint8))
+
+class ThumbnailCache(QObject):
+    '''
+    Pair thumbnails for the grid view, made on a worker pool
+    Recent thumbnails stay in memory; with a cache_dir they are also kept in a
+    PreviewCache in its thumbnails subfolder so they survive restarts, with an index
+    and size budget apart from the previews in cache_dir. thumbnail_ready(pair,
+    thumbnail) is emitted on the UI thread when a requested thumbnail becomes available.
+    '''
+    thumbnail_ready = pyqtSignal(object, object)
+    thumbnail_failed = pyqtSignal(object)
+
+    def __init__(self, tile_width, tile_height, memory_bytes=256 * 2**20, workers=4, cache_dir=None, cache_bytes=512 * 2**20):
+        super().__init__()
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+        self.memory = FrameCache(memory_bytes)
+        self.pending = {}
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbnail')
+        self.disk = None
+        if cache_dir:
+            self.disk = PreviewCache(os.path.join(cache_dir, 'thumbnails'), cache_bytes, version=f'thumb{tile_width}x{tile_height}')
+        # Emitted from worker threads, so Qt queues the calls onto the UI thread
+        self.thumbnail_ready.connect(self.store)
+        self.thumbnail_failed.connect(self.failed)
+
+    def get(self, pair):
+        '''
+        Return the thumbnail if it is in memory, else None and make it in the background
+        '''
+        thumbnail = self.memory.get(pair)
+        if thumbnail is not None:
+            return thumbnail
+        self.request([pair])
+        return None
+
+    def request(self, pairs):
+        for pair in pairs:
+            if pair not in self.memory and pair not in self.pending:
+                self.pending[pair] = self.executor.submit(self.load, pair)
+
+    def cancel_except(self, pairs):
+        '''
+        Drop queued work for pairs that are no longer on or near the visible page
+        '''
+        wanted = set(pairs)
+        for pair in list(self.pending):
+            if pair not in wanted and self.pending[pair].cancel():
+                del self.pending[pair]
+
+    def load(self, pair):
+        try:
+            key = self.disk.key(*pair) if self.disk else None
+            thumbnail = self.disk.get(key) if key else None
+            if thumbnail is None or thumbnail.shape[:2] != (self.tile_height, self.tile_width):
+                thumbnail = make_thumbnail(pair[0], pair[1], self.tile_width, self.tile_height)
+                if key:
+                    self.disk.put(key, thumbnail)
+        except Exception as e:
+            print(f"Failed to make a thumbnail for {pair[0]}: {e}")
+            self.thumbnail_failed.emit(pair)
+            return
+        self.thumbnail_ready.emit(pair, thumbnail)
+
+    def store(self, pair, thumbnail):
+        self.pending.pop(pair, None)
+        self.memory.put(pair, thumbnail)
+
+    def failed(self, pair):
+        # Requested again the next time its page is shown
+        self.pending.pop(pair, None)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
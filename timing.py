@@ -0,0 +1,106 @@
+# timing.py
+import os
+import json
+import time
+import threading
+from collections import defaultdict, deque
+
+class NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_STAGE = NullStage()
+
+class Stage:
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.start, time.perf_counter())
+        return False
+
+class Tracer:
+    '''
+    Toggleable per-stage timing for the hot paths
+    Keeps the most recent latencies per stage for live percentiles and can stream
+    every sample to a JSONL file, or a Chrome trace if the path ends in .json.
+    When disabled, stage() returns a shared no-op context manager.
+    '''
+    def __init__(self, window=500):
+        self.enabled = False
+        self.window = window
+        self.samples = defaultdict(lambda: deque(maxlen=self.window))
+        self.lock = threading.Lock()
+        self.trace_file = None
+        self.chrome = False
+        self.first_event = True
+        self.origin = time.perf_counter()
+
+    def enable(self, trace_path=None):
+        self.enabled = True
+        if trace_path and self.trace_file is None:
+            self.chrome = trace_path.endswith('.json')
+            self.trace_file = open(trace_path, 'w')
+            if self.chrome:
+                self.trace_file.write('[\n')
+
+    def disable(self):
+        self.enabled = False
+
+    def stage(self, name):
+        if not self.enabled:
+            return NULL_STAGE
+        return Stage(self, name)
+
+    def record(self, name, start, end):
+        with self.lock:
+            self.samples[name].append(end - start)
+            if self.trace_file is None:
+                return
+            if self.chrome:
+                event = {'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                         'ts': (start - self.origin) * 1e6, 'dur': (end - start) * 1e6}
+                self.trace_file.write(('' if self.first_event else ',\n') + json.dumps(event))
+                self.first_event = False
+            else:
+                event = {'stage': name, 'thread': threading.current_thread().name,
+                         'start_ms': (start - self.origin) * 1000, 'duration_ms': (end - start) * 1000}
+                self.trace_file.write(json.dumps(event) + '\n')
+
+    def percentiles(self, name):
+        '''
+        Return (p50, p95) in milliseconds for a stage, or None without samples
+        '''
+        with self.lock:
+            samples = sorted(self.samples.get(name, ()))
+        if not samples:
+            return None
+        return (samples[len(samples) // 2] * 1000,
+                samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000)
+
+    def summary(self, names=None):
+        parts = []
+        for name in names or sorted(self.samples):
+            result = self.percentiles(name)
+            if result:
+                parts.append(f'{name} p50 {result[0]:.1f} / p95 {result[1]:.1f} ms')
+        return '   '.join(parts)
+
+    def close(self):
+        with self.lock:
+            if self.trace_file is None:
+                return
+            if self.chrome:
+                self.trace_file.write('\n]\n')
+            self.trace_file.close()
+            self.trace_file = None
+
+tracer = Tracer()